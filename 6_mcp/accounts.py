@@ -1,15 +1,55 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal
 import json
+import math
+import os
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from datetime import datetime, timedelta
+from market import get_share_price, get_share_prices
+from database import (
+    ACCOUNT_STORAGE,
+    StaleAccountError,
+    write_account,
+    read_account,
+    write_log,
+    write_account_details,
+    write_trades,
+    write_portfolio_value,
+    write_portfolio_series,
+)
+from timeseries import needs_compaction, compact, series
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
 
+# How many times a change is retried on a fresh copy of the account when another writer saved it first
+ACCOUNT_WRITE_ATTEMPTS = int(os.getenv("ACCOUNT_WRITE_ATTEMPTS", "5"))
+
+account_write_stats = {"conflicts": 0}
+
+# snapshot() records at most one portfolio value point per account in this many seconds
+PORTFOLIO_SNAPSHOT_SECONDS = float(os.getenv("PORTFOLIO_SNAPSHOT_SECONDS", "60"))
+
+
+def current_time() -> datetime:
+    """ The time trades and portfolio values are stamped with; backtest.py replaces it with a simulated clock. """
+    return datetime.now()
+
+
+# What summary() shows of the transaction history: the most recent transactions, with long rationales cut short
+ACCOUNT_SUMMARY_TRANSACTIONS = int(os.getenv("ACCOUNT_SUMMARY_TRANSACTIONS", "10"))
+ACCOUNT_SUMMARY_RATIONALE_CHARS = int(os.getenv("ACCOUNT_SUMMARY_RATIONALE_CHARS", "120"))
+
+
+# The last json serialization of each account, reused by report() until the account changes
+report_cache: dict[str, tuple[tuple[int, int], str]] = {}
+
+
+def shorten(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
 
 class Transaction(BaseModel):
     symbol: str
@@ -25,6 +65,13 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    side: Literal["buy", "sell"]
+    symbol: str = Field(pattern=r"\S")  # not empty or blank
+    quantity: int = Field(gt=0)
+    rationale: str
+
+
 class Account(BaseModel):
     name: str
     balance: float
@@ -32,6 +79,11 @@ class Account(BaseModel):
     holdings: dict[str, int]
     transactions: list[Transaction]
     portfolio_value_time_series: list[tuple[str, float]]
+    portfolio_value_bars: list[tuple[str, str, float, float, float, float]] = []
+    cost_basis: dict[str, float] = {}
+    realized_pnl: float = 0.0
+    total_spend: float = 0.0
+    version: int = 0
 
     @classmethod
     def get(cls, name: str):
@@ -43,42 +95,116 @@ class Account(BaseModel):
                 "strategy": "",
                 "holdings": {},
                 "transactions": [],
-                "portfolio_value_time_series": []
+                "portfolio_value_time_series": [],
+                "portfolio_value_bars": [],
+                "cost_basis": {},
+                "realized_pnl": 0.0,
+                "total_spend": 0.0,
             }
-            write_account(name, fields)
-        return cls(**fields)
+            fields["version"] = write_account(name, fields)
+        account = cls(**fields)
+        if "total_spend" not in fields:
+            account.rebuild_aggregates()
+            account.update(account.save)
+        return account
     
     
     def save(self):
-        write_account(self.name.lower(), self.model_dump())
+        self.version = write_account(self.name.lower(), self.model_dump())
+
+    def replace_with(self, other: "Account"):
+        for field in Account.model_fields:
+            setattr(self, field, getattr(other, field))
+
+    def update(self, change):
+        """
+        Call change() to modify and save this account. If another writer saved the account after we
+        read it, the save raises StaleAccountError; reload the account and call change() again.
+        """
+        for attempt in range(ACCOUNT_WRITE_ATTEMPTS):
+            try:
+                return change()
+            except StaleAccountError:
+                account_write_stats["conflicts"] += 1
+                if attempt == ACCOUNT_WRITE_ATTEMPTS - 1:
+                    raise
+                self.replace_with(Account.get(self.name))
+
+    def save_details(self):
+        """ Persist a change to the balance or strategy. """
+        if ACCOUNT_STORAGE == "normalized":
+            self.version = write_account_details(self.name, self.balance, self.strategy, self.version)
+        else:
+            self.save()
+
+    def save_trades(self, transactions: list[Transaction]):
+        """ Persist trades that have just been applied to this account, in one database transaction. """
+        if ACCOUNT_STORAGE == "normalized":
+            totals = {"balance": self.balance, "total_spend": self.total_spend, "realized_pnl": self.realized_pnl}
+            holdings = {
+                t.symbol: (self.holdings.get(t.symbol, 0), self.cost_basis.get(t.symbol, 0.0)) for t in transactions
+            }
+            transaction_dicts = [t.model_dump() for t in transactions]
+            self.version = write_trades(self.name, totals, holdings, transaction_dicts, self.version)
+        else:
+            self.save()
+
+    def save_portfolio_value(self, point: tuple[str, float]):
+        """ Persist a point that has just been appended to the portfolio value time series. """
+        if ACCOUNT_STORAGE == "normalized":
+            write_portfolio_value(self.name, *point)
+        else:
+            self.save()
+
+    def save_portfolio_series(self, point: tuple[str, float]):
+        """ Persist a point that has just been appended, and the compacted points and bars. """
+        if ACCOUNT_STORAGE == "normalized":
+            # Compaction keeps every point from the oldest one left onwards, including the new one
+            kept_from = self.portfolio_value_time_series[0][0]
+            self.version = write_portfolio_series(self.name, point, self.portfolio_value_bars, kept_from, self.version)
+        else:
+            self.save()
 
     def reset(self, strategy: str):
-        self.balance = INITIAL_BALANCE
-        self.strategy = strategy
-        self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
-        self.save()
+        def clear():
+            self.balance = INITIAL_BALANCE
+            self.strategy = strategy
+            self.holdings = {}
+            self.transactions = []
+            self.portfolio_value_time_series = []
+            self.portfolio_value_bars = []
+            self.cost_basis = {}
+            self.realized_pnl = 0.0
+            self.total_spend = 0.0
+            self.save()
+        self.update(clear)
 
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
-        self.balance += amount
+        def deposit():
+            self.balance += amount
+            self.save_details()
+        self.update(deposit)
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
-        if amount > self.balance:
-            raise ValueError("Insufficient funds for withdrawal.")
-        self.balance -= amount
+        def withdraw():
+            if amount > self.balance:
+                raise ValueError("Insufficient funds for withdrawal.")
+            self.balance -= amount
+            self.save_details()
+        self.update(withdraw)
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
 
-    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
-        """ Buy shares of a stock if sufficient funds are available. """
-        price = get_share_price(symbol)
+    def apply_buy(self, symbol: str, quantity: int, price: float, rationale: str) -> Transaction:
+        """ Buy shares at the given market price, updating this account in memory only. """
+        if not symbol.strip():
+            raise ValueError("Cannot buy shares without a symbol.")
+        if quantity <= 0:
+            raise ValueError(f"Cannot buy {quantity} shares; the quantity must be positive.")
         buy_price = price * (1 + SPREAD)
         total_cost = buy_price * quantity
         
@@ -88,55 +214,147 @@ class Account(BaseModel):
             raise ValueError(f"Unrecognized symbol {symbol}")
         
         # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        held_before = self.holdings.get(symbol, 0)
+        self.holdings[symbol] = held_before + quantity
+        timestamp = current_time().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
         self.transactions.append(transaction)
+        self.apply_to_aggregates(transaction, held_before)
         
         # Update balance
         self.balance -= total_cost
-        self.save()
-        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return transaction
 
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
-        """ Sell shares of a stock if the user has enough shares. """
+    def apply_sell(self, symbol: str, quantity: int, price: float, rationale: str) -> Transaction:
+        """ Sell shares at the given market price, updating this account in memory only. """
+        if not symbol.strip():
+            raise ValueError("Cannot sell shares without a symbol.")
+        if quantity <= 0:
+            raise ValueError(f"Cannot sell {quantity} shares; the quantity must be positive.")
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
         
-        price = get_share_price(symbol)
         sell_price = price * (1 - SPREAD)
         total_proceeds = sell_price * quantity
         
         # Update holdings
+        held_before = self.holdings[symbol]
         self.holdings[symbol] -= quantity
         
         # If shares are completely sold, remove from holdings
         if self.holdings[symbol] == 0:
             del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = current_time().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
         self.transactions.append(transaction)
+        self.apply_to_aggregates(transaction, held_before)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
+        return transaction
+
+    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Buy shares of a stock if sufficient funds are available. """
+        price = get_share_price(symbol)
+        self.update(lambda: self.save_trades([self.apply_buy(symbol, quantity, price, rationale)]))
+        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
+        self.snapshot()
+        return "Completed. Latest details:\n" + self.report()
+
+    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+        """ Sell shares of a stock if the user has enough shares. """
+        if self.holdings.get(symbol, 0) < quantity:
+            raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
+        price = get_share_price(symbol)
+        self.update(lambda: self.save_trades([self.apply_sell(symbol, quantity, price, rationale)]))
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
+        self.snapshot()
+        return "Completed. Latest details:\n" + self.report()
+
+    def execute_orders(self, orders: list[Order]) -> str:
+        """ Execute several buys and sells together, in order: either every order succeeds or none are made. """
+        if not orders:
+            raise ValueError("No orders given.")
+        prices = get_share_prices(list(dict.fromkeys(order.symbol for order in orders)))
+
+        def execute():
+            # Apply the orders to a copy, so a failing order leaves this account untouched; only
+            # the containers that orders change are copied, not the whole history
+            draft = self.model_copy(update={
+                "holdings": dict(self.holdings),
+                "cost_basis": dict(self.cost_basis),
+                "transactions": list(self.transactions),
+            })
+            transactions = [
+                (draft.apply_buy if order.side == "buy" else draft.apply_sell)(
+                    order.symbol, order.quantity, prices[order.symbol], order.rationale
+                )
+                for order in orders
+            ]
+            self.replace_with(draft)
+            self.save_trades(transactions)
+        self.update(execute)
+        summary = ", ".join(f"{'Bought' if o.side == 'buy' else 'Sold'} {o.quantity} of {o.symbol}" for o in orders)
+        write_log(self.name, "account", summary)
+        self.snapshot()
         return "Completed. Latest details:\n" + self.report()
 
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
         total_value = self.balance
+        prices = get_share_prices(list(self.holdings))
         for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
+            total_value += prices[symbol] * quantity
         return total_value
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.total_spend - self.balance
+
+    def apply_to_aggregates(self, transaction: Transaction, held_before: int):
+        """ Update the running cost basis, realized P&L and total spend with one transaction. """
+        symbol = transaction.symbol
+        self.total_spend += transaction.total()
+        if transaction.quantity > 0:
+            self.cost_basis[symbol] = self.cost_basis.get(symbol, 0.0) + transaction.total()
+            return
+        sold = -transaction.quantity
+        if held_before <= 0:
+            # Only legacy histories have these: zero or negative trades, or sales of shares not held,
+            # which have no cost to apportion
+            self.realized_pnl += sold * transaction.price
+            return
+        cost = self.cost_basis.get(symbol, 0.0) * min(sold, held_before) / held_before
+        self.realized_pnl += sold * transaction.price - cost
+        if sold >= held_before:
+            self.cost_basis.pop(symbol, None)
+        else:
+            self.cost_basis[symbol] -= cost
+
+    def rebuild_aggregates(self):
+        """ Recompute the running aggregates from scratch by replaying the transaction log. """
+        self.cost_basis, self.realized_pnl, self.total_spend = {}, 0.0, 0.0
+        held = {}
+        for transaction in self.transactions:
+            self.apply_to_aggregates(transaction, held.get(transaction.symbol, 0))
+            held[transaction.symbol] = held.get(transaction.symbol, 0) + transaction.quantity
+
+    def check_aggregates(self) -> list[str]:
+        """ Rebuild the aggregates from the transaction log and describe any that disagree with the running values. """
+        rebuilt = self.model_copy(deep=True)
+        rebuilt.rebuild_aggregates()
+        problems = []
+        for field in ("total_spend", "realized_pnl"):
+            running, expected = getattr(self, field), getattr(rebuilt, field)
+            if not math.isclose(running, expected, abs_tol=1e-6):
+                problems.append(f"{field} is {running} but the transactions give {expected}")
+        for symbol in self.cost_basis.keys() | rebuilt.cost_basis.keys():
+            running, expected = self.cost_basis.get(symbol, 0.0), rebuilt.cost_basis.get(symbol, 0.0)
+            if not math.isclose(running, expected, abs_tol=1e-6):
+                problems.append(f"cost basis of {symbol} is {running} but the transactions give {expected}")
+        return problems
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -146,21 +364,72 @@ class Account(BaseModel):
         """ Report the user's profit or loss at any point in time. """
         return self.calculate_profit_loss()
 
+    def get_portfolio_value_series(self, resolution: str = "raw") -> list[tuple[str, float]]:
+        """ Return the portfolio value history at the given resolution: raw, hour or day. """
+        return series(self.portfolio_value_time_series, self.portfolio_value_bars, resolution)
+
     def list_transactions(self):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
+    def snapshot(self) -> bool:
+        """ Record the current portfolio value, unless a point was recorded in the last PORTFOLIO_SNAPSHOT_SECONDS. """
+        def record() -> bool:
+            now = current_time()
+            if self.portfolio_value_time_series:
+                last = datetime.strptime(self.portfolio_value_time_series[-1][0], "%Y-%m-%d %H:%M:%S")
+                if now - last < timedelta(seconds=PORTFOLIO_SNAPSHOT_SECONDS):
+                    return False
+            point = (now.strftime("%Y-%m-%d %H:%M:%S"), self.calculate_portfolio_value())
+            self.portfolio_value_time_series.append(point)
+            if needs_compaction(self.portfolio_value_time_series, now):
+                self.portfolio_value_time_series, self.portfolio_value_bars = compact(
+                    self.portfolio_value_time_series, self.portfolio_value_bars, now
+                )
+                self.save_portfolio_series(point)
+            else:
+                self.save_portfolio_value(point)
+            return True
+        return self.update(record)
+
+    def serialize(self) -> str:
+        """ Return the account as json, reusing the cached serialization while the stored account is unchanged. """
+        # Every write bumps the version, except appending a portfolio value point in normalized storage
+        key = (self.version, len(self.portfolio_value_time_series))
+        cached = report_cache.get(self.name)
+        if cached and cached[0] == key:
+            return cached[1]
+        account_json = self.model_dump_json()
+        report_cache[self.name] = (key, account_json)
+        return account_json
+
     def report(self) -> str:
-        """ Return a json string representing the account.  """
+        """ Return a json string representing the account, valued at current prices. This writes nothing. """
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
-        data["total_portfolio_value"] = portfolio_value
-        data["total_profit_loss"] = pnl
-        write_log(self.name, "account", f"Retrieved account details")
-        return json.dumps(data)
+        totals = json.dumps({"total_portfolio_value": portfolio_value, "total_profit_loss": pnl})
+        return self.serialize()[:-1] + "," + totals[1:]
+
+    def summary(self, last_n: int = ACCOUNT_SUMMARY_TRANSACTIONS, rationale_chars: int = ACCOUNT_SUMMARY_RATIONALE_CHARS) -> str:
+        """ Return a compact json summary for prompts: cash, holdings, P&L and the last few transactions. This writes nothing. """
+        portfolio_value = self.calculate_portfolio_value()
+        recent = [
+            transaction.model_dump() | {
+                "price": round(transaction.price, 2),
+                "rationale": shorten(transaction.rationale, rationale_chars),
+            }
+            for transaction in self.transactions[-last_n:]
+        ] if last_n else []
+        return json.dumps({
+            "name": self.name,
+            "balance": round(self.balance, 2),
+            "holdings": self.holdings,
+            "total_portfolio_value": round(portfolio_value, 2),
+            "total_profit_loss": round(self.calculate_profit_loss(portfolio_value), 2),
+            "realized_profit_loss": round(self.realized_pnl, 2),
+            "transaction_count": len(self.transactions),
+            "recent_transactions": recent,
+        })
     
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
@@ -169,8 +438,10 @@ class Account(BaseModel):
     
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
-        self.strategy = strategy
-        self.save()
+        def change():
+            self.strategy = strategy
+            self.save_details()
+        self.update(change)
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
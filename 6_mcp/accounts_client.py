@@ -1,39 +1,167 @@
 import mcp
 from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
 from agents import FunctionTool
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+import anyio
+import asyncio
 import json
+import os
+import time
+from mcp_servers import SessionOwner
+
+load_dotenv(override=True)
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+# How many accounts_server processes to keep warm for concurrent callers
+ACCOUNTS_CLIENT_POOL_SIZE = int(os.getenv("ACCOUNTS_CLIENT_POOL_SIZE", "2"))
 
-async def list_accounts_tools():
+
+@asynccontextmanager
+async def open_session():
+    """Start an accounts_server process and yield an initialized session with it"""
     async with stdio_client(params) as streams:
         async with mcp.ClientSession(*streams) as session:
             await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+            yield session
+
+
+class AccountsSessionPool:
+    """
+    Keeps up to `size` accounts_server processes running with initialized sessions, and
+    lends each one to a single caller at a time.
+
+    Each session is held open by a SessionOwner. A session whose server has died, or whose
+    call failed other than with an MCP error response, is discarded and replaced on demand;
+    call() retries on another session if the request could not even be sent.
+    """
+
+    def __init__(self, size: int = ACCOUNTS_CLIENT_POOL_SIZE):
+        self.size = size
+        self.loop = None
+        self.slots = None
+        self.idle = None
+        self.workers = {}
+        self.spawns = 0
+        self.handshake_seconds = 0.0
+        self.calls_since_report = 0
+        self.spawns_since_report = 0
+
+    def bind(self):
+        """Start afresh if we're now running under a different event loop"""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.slots = asyncio.Semaphore(self.size)
+            self.idle = asyncio.Queue()
+            self.workers = {}
+
+    async def spawn(self) -> mcp.ClientSession:
+        start = time.perf_counter()
+        owner = SessionOwner(open_session, "accounts_server session")
+        session = await owner.ready
+        self.workers[session] = owner
+        self.spawns += 1
+        self.spawns_since_report += 1
+        self.handshake_seconds += time.perf_counter() - start
+        return session
+
+    def discard(self, session: mcp.ClientSession):
+        self.workers.pop(session).stop.set()
+
+    async def checkout(self) -> mcp.ClientSession:
+        await self.slots.acquire()
+        try:
+            while not self.idle.empty():
+                session = self.idle.get_nowait()
+                if self.workers[session].running():
+                    return session
+                self.discard(session)
+            return await self.spawn()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    @asynccontextmanager
+    async def session(self):
+        self.bind()
+        session = await self.checkout()
+        healthy = True
+        try:
+            yield session
+        except McpError as e:
+            healthy = e.error.code != CONNECTION_CLOSED
+            raise
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            if healthy and self.workers[session].running():
+                self.idle.put_nowait(session)
+            else:
+                self.discard(session)
+            self.slots.release()
+
+    async def call(self, operation):
+        """Await operation(session) on a pooled session"""
+        self.calls_since_report += 1
+        for attempt in range(self.size + 1):
+            try:
+                async with self.session() as session:
+                    return await operation(session)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                # The server went away while idle and the request was never sent, so it's
+                # safe to retry; after every idle session has been tried, a fresh one is spawned
+                if attempt == self.size:
+                    raise
+
+    def report(self) -> str:
+        """Summarize the calls since the last report, and the spawn and handshake time they avoided"""
+        calls, spawns = self.calls_since_report, self.spawns_since_report
+        self.calls_since_report = self.spawns_since_report = 0
+        mean_handshake = self.handshake_seconds / self.spawns if self.spawns else 0.0
+        saved = (calls - spawns) * mean_handshake
+        return (
+            f"Accounts MCP pool: {calls} calls, {spawns} spawns, "
+            f"~{saved:.1f}s of spawn/handshake saved at {mean_handshake:.2f}s each"
+        )
+
+    async def close(self):
+        for session in list(self.workers):
+            await self.workers.pop(session).close()
+        self.idle = asyncio.Queue()
+
+
+pool = AccountsSessionPool()
+
+
+async def list_accounts_tools():
+    tools_result = await pool.call(lambda session: session.list_tools())
+    return tools_result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
+    result = await pool.call(lambda session: session.call_tool(tool_name, tool_args))
+    return result
+
 async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    result = await pool.call(lambda session: session.read_resource(f"accounts://accounts_server/{name}"))
+    return result.contents[0].text
+
+async def read_summary_resource(name):
+    result = await pool.call(lambda session: session.read_resource(f"accounts://summary/{name}"))
+    return result.contents[0].text
+
+async def read_analytics_resource(name):
+    result = await pool.call(lambda session: session.read_resource(f"accounts://analytics/{name}"))
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await pool.call(lambda session: session.read_resource(f"accounts://strategy/{name}"))
+    return result.contents[0].text
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +172,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
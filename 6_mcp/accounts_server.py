@@ -1,5 +1,9 @@
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from util import run_mcp_server
+from accounts import Account, Order
+from database import read_balance, read_holdings
+from analytics import get_analytics
+import json
 
 mcp = FastMCP("accounts_server")
 
@@ -10,7 +14,8 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    balance = read_balance(name)
+    return Account.get(name).balance if balance is None else balance
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,7 +24,8 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    holdings = read_holdings(name)
+    return Account.get(name).holdings if holdings is None else holdings
 
 @mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
@@ -46,6 +52,17 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
     """
     return Account.get(name).sell_shares(symbol, quantity, rationale)
 
+@mcp.tool()
+async def execute_orders(name: str, orders: list[Order]) -> str:
+    """Buy and sell several stocks in one call, such as when rebalancing. The orders are executed
+    in the order given, and either all of them are executed or, if any one fails, none are.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with a side of "buy" or "sell", the symbol, the quantity of shares and the rationale
+    """
+    return Account.get(name).execute_orders(orders)
+
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
     """At your discretion, if you choose to, call this to change your investment strategy for the future.
@@ -59,12 +76,21 @@ async def change_strategy(name: str, strategy: str) -> str:
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
     account = Account.get(name.lower())
+    account.snapshot()
     return account.report()
 
+@mcp.resource("accounts://summary/{name}")
+async def read_summary_resource(name: str) -> str:
+    return Account.get(name.lower()).summary()
+
+@mcp.resource("accounts://analytics/{name}")
+async def read_analytics_resource(name: str) -> str:
+    return json.dumps(get_analytics([name])[name.lower()])
+
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
     account = Account.get(name.lower())
     return account.get_strategy()
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    run_mcp_server(mcp)
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Performance analytics across every trader at once: returns, drawdown, Sharpe ratio, turnover
+and per-symbol P&L attribution.
+
+All the traders' portfolio value series go into one DataFrame and all their transactions into
+another, and each metric is one grouped, vectorized operation over them, so a refresh is a
+single pass however many traders there are. Results are cached against the accounts' change
+markers (see database.read_change_markers), so they're only recomputed after an account is next
+written; attribution values current holdings at the prices when it was computed.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import accounts
+from accounts import Account, INITIAL_BALANCE
+from database import read_change_markers
+
+load_dotenv(override=True)
+
+TRADING_DAYS_PER_YEAR = 252
+# Annual risk-free rate subtracted from returns in the Sharpe ratio
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.0"))
+
+# The last analytics for each group of names, with the change markers they were computed at
+analytics_cache: dict[tuple[str, ...], tuple[tuple, dict]] = {}
+
+
+def value_frame(traders: list[Account]) -> pd.DataFrame:
+    """Every trader's portfolio value series, one row per point, ordered by time within each trader"""
+    rows = [
+        (account.name, when, value)
+        for account in traders
+        for when, value in account.get_portfolio_value_series()
+    ]
+    # Explicit types, so a floor with no points yet still gives numeric columns to group over
+    df = pd.DataFrame(rows, columns=["name", "datetime", "value"]).astype({"name": str, "value": float})
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    return df.sort_values(["name", "datetime"], kind="stable")
+
+
+def transaction_frame(traders: list[Account]) -> pd.DataFrame:
+    """Every trader's transactions, with the signed cash each one moved"""
+    rows = [
+        (account.name, transaction.symbol, transaction.quantity, transaction.price)
+        for account in traders
+        for transaction in account.transactions
+    ]
+    df = pd.DataFrame(rows, columns=["name", "symbol", "quantity", "price"]).astype({"quantity": int, "price": float})
+    df["value"] = df["quantity"] * df["price"]
+    return df
+
+
+def holding_frame(traders: list[Account]) -> pd.DataFrame:
+    """Every trader's holdings, valued at current prices fetched in one call for all of them"""
+    rows = [(account.name, symbol, quantity) for account in traders for symbol, quantity in account.holdings.items()]
+    df = pd.DataFrame(rows, columns=["name", "symbol", "quantity"]).astype({"quantity": int})
+    prices = accounts.get_share_prices(sorted(set(df["symbol"]))) if len(df) else {}
+    df["market_value"] = df["quantity"] * df["symbol"].map(prices).astype(float)
+    return df
+
+
+def performance(values: pd.DataFrame, trades: pd.DataFrame, names: list[str]) -> pd.DataFrame:
+    """Returns, drawdown, volatility, Sharpe ratio and turnover for each name, as one row each"""
+    by_name = values.groupby("name")["value"]
+    start = by_name.first().reindex(names, fill_value=INITIAL_BALANCE)
+    end = by_name.last().reindex(names, fill_value=INITIAL_BALANCE)
+    drawdown = values["value"] / by_name.cummax() - 1
+
+    daily = values.groupby(["name", values["datetime"].dt.normalize()])["value"].last()
+    daily_returns = daily.groupby(level="name").pct_change().dropna()
+    excess = daily_returns - RISK_FREE_RATE / TRADING_DAYS_PER_YEAR
+    by_day = excess.groupby(level="name")
+    volatility = daily_returns.groupby(level="name").std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    sharpe = by_day.mean() / by_day.std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    traded = trades["value"].abs().groupby(trades["name"]).sum().reindex(names, fill_value=0.0)
+    trade_count = trades.groupby("name").size().reindex(names, fill_value=0)
+    average_value = by_name.mean().reindex(names, fill_value=INITIAL_BALANCE)
+
+    return pd.DataFrame({
+        "start_value": start,
+        "end_value": end,
+        "total_return": end / start - 1,
+        "max_drawdown": drawdown.groupby(values["name"]).min().reindex(names, fill_value=0.0),
+        "current_drawdown": drawdown.groupby(values["name"]).last().reindex(names, fill_value=0.0),
+        "volatility": volatility.reindex(names),
+        "sharpe_ratio": sharpe.replace([np.inf, -np.inf], np.nan).reindex(names),
+        "trades": trade_count,
+        "traded_value": traded,
+        "turnover": traded / average_value,
+    }, index=pd.Index(names, name="name"))
+
+
+def attribution(trades: pd.DataFrame, holdings: pd.DataFrame) -> pd.DataFrame:
+    """
+    P&L by name and symbol: the cash the symbol's trades took in or paid out, plus the current
+    value of what's still held. Summed over symbols, it's each trader's total trading P&L.
+    """
+    cash = -trades.groupby(["name", "symbol"])["value"].sum()
+    market_value = holdings.set_index(["name", "symbol"])["market_value"]
+    df = pd.concat([cash.rename("cash_flow"), market_value], axis=1).fillna(0.0)
+    df["pnl"] = df["cash_flow"] + df["market_value"]
+    return df.sort_index()
+
+
+def compute_analytics(traders: list[Account]) -> dict[str, dict]:
+    """Analytics for each of the accounts, keyed by name, in a json-ready form"""
+    names = [account.name for account in traders]
+    trades = transaction_frame(traders)
+    summary = performance(value_frame(traders), trades, names).round(6)
+    symbols = attribution(trades, holding_frame(traders)).round(2)
+    result = {}
+    for name, metrics in summary.astype(object).where(summary.notna(), None).to_dict("index").items():
+        metrics["attribution"] = {}
+        result[name] = metrics
+    for (name, symbol), pnl, market_value in zip(symbols.index, symbols["pnl"], symbols["market_value"]):
+        result[name]["attribution"][symbol] = {"pnl": float(pnl), "market_value": float(market_value)}
+    return result
+
+
+def get_analytics(names: list[str]) -> dict[str, dict]:
+    """Analytics for the named accounts, reusing the last results until one of them is written"""
+    names = tuple(name.lower() for name in names)
+    markers = read_change_markers(list(names))
+    key = tuple(markers.get(name, (None, None))[0] for name in names)
+    cached = analytics_cache.get(names)
+    if cached and cached[0] == key:
+        return cached[1]
+    result = compute_analytics([Account.get(name) for name in names])
+    analytics_cache[names] = (key, result)
+    return result
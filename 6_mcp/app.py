@@ -1,10 +1,16 @@
 import gradio as gr
 from util import css, js, Color
 import pandas as pd
-from trading_floor import names, lastnames, short_model_names
+import os
+import threading
+from collections import deque
+from functools import partial
+from trading_floor import names, lastnames, short_model_names, TRADING_FLOOR_MODE
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from analytics import get_analytics
+from database import read_log_since, read_job_counts, read_workers, WORKER_HEARTBEAT_SECONDS
+from change_feed import ChangeFeed, CHANGE_FEED_POLL_SECONDS
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,16 +21,61 @@ mapper = {
     "account": Color.RED,
 }
 
+# How many of the most recent log lines each trader's panel keeps
+DASHBOARD_LOG_LINES = int(os.getenv("DASHBOARD_LOG_LINES", "13"))
+
 
 class Trader:
     def __init__(self, name: str, lastname: str, model_name: str):
         self.name = name
         self.lastname = lastname
         self.model_name = model_name
-        self.account = Account.get(name)
+        self.log_lines = deque(maxlen=DASHBOARD_LOG_LINES)
+        self.last_log_id = 0
+        # The rendered components, rebuilt once per change however many tabs are viewing them,
+        # and how many times the account and the log have changed so each tab can tell what's new
+        self.views = {}
+        self.revisions = {"account": 0, "log": 0}
+        self.lock = threading.Lock()
+        self.refresh_account()
+        self.refresh_logs()
+
+    def on_change(self, kind: str):
+        if kind == "account":
+            self.refresh_account()
+        else:
+            self.refresh_logs()
 
-    def reload(self):
+    def refresh_account(self):
         self.account = Account.get(self.name)
+        views = {
+            "portfolio_value": self.get_portfolio_value(),
+            "analytics": self.get_analytics(),
+            "chart": self.get_portfolio_value_chart(),
+            "holdings": self.get_holdings_df(),
+            "transactions": self.get_transactions_df(),
+        }
+        with self.lock:
+            self.views.update(views)
+            self.revisions["account"] += 1
+
+    def refresh_logs(self):
+        logs = self.get_logs()
+        with self.lock:
+            self.views["logs"] = logs
+            self.revisions["log"] += 1
+
+    def get_view(self, key: str):
+        with self.lock:
+            return self.views[key]
+
+    def get_changes(self, seen: tuple[int, int]) -> tuple[tuple[int, int], dict | None, str | None]:
+        """The current revisions, plus the account components and the logs if they've changed since seen"""
+        with self.lock:
+            revisions = (self.revisions["account"], self.revisions["log"])
+            account_views = dict(self.views) if revisions[0] != seen[0] else None
+            logs = self.views["logs"] if revisions[1] != seen[1] else None
+        return revisions, account_views, logs
 
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
@@ -33,7 +84,7 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+        df = pd.DataFrame(self.account.get_portfolio_value_series(), columns=["datetime", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
@@ -80,23 +131,37 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
+    def get_analytics(self) -> str:
+        """Summarize the trader's performance, and the P&L of its three biggest contributors"""
+        metrics = get_analytics(names)[self.name.lower()]
+        sharpe = "n/a" if metrics["sharpe_ratio"] is None else f"{metrics['sharpe_ratio']:.2f}"
+        attribution = sorted(metrics["attribution"].items(), key=lambda item: -abs(item[1]["pnl"]))[:3]
+        contributors = " &nbsp; ".join(f"{symbol} ${item['pnl']:,.0f}" for symbol, item in attribution)
+        return (
+            f"<div style='text-align: center;font-size:14px;'>Return {metrics['total_return']:+.1%} &nbsp; "
+            f"Max drawdown {metrics['max_drawdown']:.1%} &nbsp; Sharpe {sharpe} &nbsp; "
+            f"Turnover {metrics['turnover']:.2f}x<br/>{contributors}</div>"
+        )
+
+    def get_logs(self) -> str:
+        """Fetch only the log lines written since the last fetch and append them to the panel"""
+        logs = read_log_since(self.name, self.last_log_id, last_n=DASHBOARD_LOG_LINES)
         for log in logs:
-            timestamp, type, message = log
+            log_id, timestamp, type, message = log
             color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+            self.log_lines.append(
+                f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
+            )
+            self.last_log_id = log_id
+        response = "".join(self.log_lines)
+        return f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
 
 
 class TraderView:
     def __init__(self, trader: Trader):
         self.trader = trader
         self.portfolio_value = None
+        self.analytics = None
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
@@ -105,16 +170,18 @@ class TraderView:
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML(partial(self.trader.get_view, "portfolio_value"))
+            with gr.Row():
+                self.analytics = gr.HTML(partial(self.trader.get_view, "analytics"))
             with gr.Row():
                 self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
+                    partial(self.trader.get_view, "chart"), container=True, show_label=False
                 )
             with gr.Row(variant="panel"):
-                self.log = gr.HTML(self.trader.get_logs)
+                self.log = gr.HTML(partial(self.trader.get_view, "logs"))
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
+                    value=partial(self.trader.get_view, "holdings"),
                     label="Holdings",
                     headers=["Symbol", "Quantity"],
                     row_count=(5, "dynamic"),
@@ -124,7 +191,7 @@ class TraderView:
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
+                    value=partial(self.trader.get_view, "transactions"),
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -133,36 +200,45 @@ class TraderView:
                     elem_classes=["dataframe-fix"],
                 )
 
-        timer = gr.Timer(value=120)
+        # Each tab only compares revision numbers in memory, and is sent just the components
+        # that changed; the change feed does the database reads, once for all tabs
+        seen = gr.State((0, 0))
+        timer = gr.Timer(value=CHANGE_FEED_POLL_SECONDS)
         timer.tick(
             fn=self.refresh,
-            inputs=[],
+            inputs=[seen],
             outputs=[
                 self.portfolio_value,
+                self.analytics,
                 self.chart,
                 self.holdings_table,
                 self.transactions_table,
+                self.log,
+                seen,
             ],
             show_progress="hidden",
             queue=False,
         )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
-            show_progress="hidden",
-            queue=False,
-        )
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+    def refresh(self, seen):
+        revisions, account_views, logs = self.trader.get_changes(seen)
+        keys = ("portfolio_value", "analytics", "chart", "holdings", "transactions")
+        updates = [account_views[key] if account_views else gr.update() for key in keys]
+        return (*updates, logs if logs is not None else gr.update(), revisions)
+
+
+def get_queue_status() -> str:
+    """Summarize the job queue and the workers heard from in the last hour, for queue mode"""
+    counts = read_job_counts()
+    jobs = ", ".join(f"{counts.get(status, 0)} {status}" for status in ("queued", "running", "done", "failed"))
+    workers = []
+    for name, age, job_id in read_workers():
+        if age > 3600:
+            continue
+        color = Color.RED if age > 3 * WORKER_HEARTBEAT_SECONDS else Color.GREEN
+        state = f"running job {job_id}" if job_id else "idle"
+        workers.append(f"<span style='color:{color.value}'>{name}: {state}, heartbeat {age:.0f}s ago</span>")
+    return f"<div style='text-align: center;'>Jobs: {jobs}<br/>{'<br/>'.join(workers) or 'No workers'}</div>"
 
 
 # Main UI construction
@@ -174,6 +250,10 @@ def create_ui():
         for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
     ]
     trader_views = [TraderView(trader) for trader in traders]
+    feed = ChangeFeed(names)
+    traders_by_name = {trader.name.lower(): trader for trader in traders}
+    feed.subscribe(lambda name, kind: traders_by_name[name].on_change(kind))
+    feed.start()
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
@@ -181,6 +261,11 @@ def create_ui():
         with gr.Row():
             for trader_view in trader_views:
                 trader_view.make_ui()
+        if TRADING_FLOOR_MODE == "queue":
+            with gr.Row(variant="panel"):
+                queue_status = gr.HTML(get_queue_status)
+            queue_timer = gr.Timer(value=5)
+            queue_timer.tick(fn=get_queue_status, outputs=[queue_status], show_progress="hidden", queue=False)
 
     return ui
 
@@ -0,0 +1,195 @@
+"""
+Replay the trading floor offline, against recorded prices and a simulated clock.
+
+    uv run backtest.py [--prices prices.csv] [--days 250] [--cycles-per-day 7] [--seed 0]
+
+Prices come from a CSV or Parquet file with date, symbol and close columns, or else from the
+market_prices table, or else a seeded random walk. The traders from reset.py are replayed in a
+private in-memory database, with Account's prices and clock bound to the simulation, and with
+a deterministic StubModel making the decisions the LLM makes live. The stub calls the same
+Account methods as the accounts MCP tools, so the run exercises the real accounting code.
+Set ACCOUNT_STORAGE=normalized for the fastest runs, as JSON storage rewrites each account on every trade.
+"""
+
+import argparse
+import bisect
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import accounts
+import database
+from accounts import Account, Order
+
+SYMBOLS = ["SPY", "QQQ", "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "IBIT"]
+SESSION_START = timedelta(hours=9, minutes=30)
+SESSION_MINUTES = 390
+
+
+class PriceHistory:
+    """Daily closing prices; a symbol's price at any moment is its latest close on or before that day"""
+
+    def __init__(self, rows: list[tuple[str, str, float]]):
+        self.closes: dict[str, tuple[list[str], list[float]]] = {}
+        for day, symbol, close in sorted(rows):
+            days, prices = self.closes.setdefault(symbol, ([], []))
+            days.append(day)
+            prices.append(close)
+        self.dates = sorted({row[0] for row in rows})
+
+    @classmethod
+    def from_database(cls, symbols: list[str]) -> "PriceHistory":
+        return cls(database.read_price_history(symbols))
+
+    @classmethod
+    def from_file(cls, path: str) -> "PriceHistory":
+        import pandas as pd
+
+        df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        return cls([(str(day)[:10], symbol, float(close)) for day, symbol, close in df[["date", "symbol", "close"]].itertuples(index=False)])
+
+    @classmethod
+    def random_walk(cls, symbols: list[str], days: int, seed: int) -> "PriceHistory":
+        rng = random.Random(seed)
+        rows, day = [], date(2024, 1, 2)
+        prices = {symbol: rng.uniform(20, 500) for symbol in symbols}
+        while len({row[0] for row in rows}) < days:
+            if day.weekday() < 5:
+                for symbol in symbols:
+                    prices[symbol] *= 1 + rng.gauss(0.0003, 0.02)
+                    rows.append((day.isoformat(), symbol, round(prices[symbol], 2)))
+            day += timedelta(days=1)
+        return cls(rows)
+
+    def price(self, symbol: str, when: datetime) -> float:
+        """The close on or before when's date, or 0.0 for a symbol with no history, like an unknown symbol live"""
+        if symbol not in self.closes:
+            return 0.0
+        days, prices = self.closes[symbol]
+        index = bisect.bisect_right(days, when.strftime("%Y-%m-%d")) - 1
+        return prices[max(index, 0)]
+
+
+class SimulatedClock:
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+
+class StubModel:
+    """
+    A deterministic stand-in for the trader's LLM: buys the symbol with the best momentum
+    over the lookback, sells holdings that have fallen, and sometimes sits on its hands.
+    The same seed and prices always give the same orders.
+    """
+
+    def __init__(self, seed: int, lookback_days: int = 5, trade_probability: float = 0.5, position_fraction: float = 0.1):
+        self.rng = random.Random(seed)
+        self.lookback = timedelta(days=lookback_days)
+        self.trade_probability = trade_probability
+        self.position_fraction = position_fraction
+
+    def decide(self, account: Account, history: PriceHistory, when: datetime) -> list[Order]:
+        if self.rng.random() > self.trade_probability:
+            return []
+        momentum = {}
+        for symbol in history.closes:
+            before = history.price(symbol, when - self.lookback)
+            momentum[symbol] = history.price(symbol, when) / before - 1 if before else 0.0
+        orders = [
+            Order(side="sell", symbol=symbol, quantity=max(quantity // 2, 1), rationale="Momentum has turned negative")
+            for symbol, quantity in sorted(account.holdings.items())
+            if momentum.get(symbol, 0.0) < -0.02
+        ]
+        best = max(sorted(momentum), key=momentum.get)
+        price = history.price(best, when)
+        quantity = int(account.balance * self.position_fraction / (price * (1 + accounts.SPREAD)))
+        if momentum[best] > 0 and quantity > 0:
+            orders.append(Order(side="buy", symbol=best, quantity=quantity, rationale="Strongest recent momentum"))
+        return orders
+
+
+@contextmanager
+def simulation(clock: SimulatedClock, history: PriceHistory):
+    """Bind Account's prices and clock to the simulation, and give it a private in-memory database"""
+    saved = (accounts.get_share_price, accounts.get_share_prices, accounts.current_time, database.DB)
+    accounts.get_share_price = lambda symbol: history.price(symbol, clock.now())
+    accounts.get_share_prices = lambda symbols: {symbol: history.price(symbol, clock.now()) for symbol in symbols}
+    accounts.current_time = clock.now
+    database.DB = ":memory:"
+    database.create_tables()
+    accounts.report_cache.clear()
+    database.projection_cache.clear()
+    try:
+        yield
+    finally:
+        database.close_connection()
+        accounts.get_share_price, accounts.get_share_prices, accounts.current_time, database.DB = saved
+        accounts.report_cache.clear()
+        database.projection_cache.clear()
+
+
+def run_backtest(history: PriceHistory, cycles_per_day: int = 7, seed: int = 0) -> dict:
+    """Run every trader from reset.py through each day of the history, and summarize how each did"""
+    from reset import reset_traders
+    from trading_floor import names
+
+    step = timedelta(minutes=SESSION_MINUTES / cycles_per_day)
+    clock = SimulatedClock(datetime.fromisoformat(history.dates[0]) + SESSION_START)
+    results = {}
+    start = time.perf_counter()
+    with simulation(clock, history):
+        reset_traders()
+        traders = {name: (Account.get(name), StubModel(seed + index)) for index, name in enumerate(names)}
+        stats = {name: {"trades": 0, "rejected": 0} for name in names}
+        for day in history.dates:
+            for cycle in range(cycles_per_day):
+                clock.current = datetime.fromisoformat(day) + SESSION_START + cycle * step
+                for name, (account, model) in traders.items():
+                    orders = model.decide(account, history, clock.now())
+                    try:
+                        if orders:
+                            account.execute_orders(orders)
+                            stats[name]["trades"] += len(orders)
+                        else:
+                            account.snapshot()
+                    except ValueError:
+                        stats[name]["rejected"] += 1
+        for name, (account, _) in traders.items():
+            portfolio_value = account.calculate_portfolio_value()
+            results[name] = stats[name] | {
+                "portfolio_value": portfolio_value,
+                "profit_loss": account.calculate_profit_loss(portfolio_value),
+                "realized_pnl": account.realized_pnl,
+                "problems": account.check_aggregates(),
+            }
+    elapsed = time.perf_counter() - start
+    cycles = len(history.dates) * cycles_per_day
+    return {"cycles": cycles, "seconds": elapsed, "traders": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prices", help="CSV or Parquet file with date, symbol and close columns")
+    parser.add_argument("--days", type=int, default=250, help="Days of random walk, when there's no recorded history")
+    parser.add_argument("--cycles-per-day", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    history = PriceHistory.from_file(args.prices) if args.prices else PriceHistory.from_database(SYMBOLS)
+    if not history.dates:
+        print(f"No recorded prices; using a {args.days} day random walk")
+        history = PriceHistory.random_walk(SYMBOLS, args.days, args.seed)
+    result = run_backtest(history, args.cycles_per_day, args.seed)
+
+    rate = result["cycles"] / result["seconds"] * 60
+    print(f"{result['cycles']:,} cycles over {len(history.dates)} days in {result['seconds']:.1f}s ({rate:,.0f} cycles/minute)")
+    for name, summary in result["traders"].items():
+        status = "consistent" if not summary["problems"] else "INCONSISTENT: " + "; ".join(summary["problems"])
+        print(
+            f"  {name}: value ${summary['portfolio_value']:,.2f}, P&L ${summary['profit_loss']:,.2f}, "
+            f"realized ${summary['realized_pnl']:,.2f}, {summary['trades']} trades, "
+            f"{summary['rejected']} rejected, {status}"
+        )
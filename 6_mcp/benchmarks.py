@@ -0,0 +1,310 @@
+"""
+Micro-benchmarks for the trading floor's hot paths.
+
+Run with: uv run benchmarks.py [name ...]   (no names runs them all)
+
+The accounts stress test raises, exiting non-zero, if it leaves the account inconsistent.
+"""
+
+import sys
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import os
+import statistics
+import database
+
+THREADS = 4
+OPS_PER_THREAD = 500
+
+sample_account = {
+    "name": "bench",
+    "balance": 10_000.0,
+    "strategy": "Buy low, sell high",
+    "holdings": {"AAPL": 10, "MSFT": 5},
+    "transactions": [],
+    "portfolio_value_time_series": [],
+}
+
+
+def legacy_ops(db: str):
+    """The original database.py pattern: a fresh connection and commit per call"""
+
+    def write_account(name, account_dict):
+        with sqlite3.connect(db) as conn:
+            conn.execute(
+                "INSERT INTO accounts (name, account) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+                (name, json.dumps(account_dict)),
+            )
+            conn.commit()
+
+    def read_account(name):
+        with sqlite3.connect(db) as conn:
+            row = conn.execute("SELECT account FROM accounts WHERE name = ?", (name,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def write_log(name, type, message):
+        with sqlite3.connect(db) as conn:
+            conn.execute(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                (name, type, message),
+            )
+            conn.commit()
+
+    def read_log(name, last_n=10):
+        with sqlite3.connect(db) as conn:
+            return conn.execute(
+                "SELECT datetime, type, message FROM logs WHERE name = ? ORDER BY datetime DESC LIMIT ?",
+                (name, last_n),
+            ).fetchall()
+
+    return write_account, read_account, write_log, read_log
+
+
+def pooled_ops():
+    return database.write_account, database.read_account, database.write_log, database.read_log
+
+
+def run_mixed_workload(ops) -> float:
+    """Each thread does a trade-like mix: 1 account write, 1 log write, 2 account reads, 1 log tail"""
+    write_account, read_account, write_log, read_log = ops
+    errors = []
+
+    def worker(index):
+        name = f"trader{index}"
+        try:
+            for i in range(OPS_PER_THREAD // 5):
+                write_account(name, sample_account)
+                write_log(name, "account", f"Bought {i} of AAPL")
+                read_account(name)
+                read_account(name)
+                list(read_log(name, last_n=13))
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f"  {len(errors)} threads failed, first error: {errors[0]}")
+    return THREADS * OPS_PER_THREAD / elapsed
+
+
+def bench_database():
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        database.DB = legacy_db
+        database.create_tables()
+        database.close_connection()
+        with sqlite3.connect(legacy_db) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        before = run_mixed_workload(legacy_ops(legacy_db))
+
+        database.DB = os.path.join(tmp, "pooled.db")
+        database.create_tables()
+        after = run_mixed_workload(pooled_ops())
+
+    print(f"database: {THREADS} threads, mixed read/write")
+    print(f"  per-call connections: {before:,.0f} ops/sec")
+    print(f"  pooled WAL connections: {after:,.0f} ops/sec ({after / before:.1f}x)")
+
+
+def time_lookups(lookup, symbols) -> list[float]:
+    timings = []
+    for symbol in symbols:
+        start = time.perf_counter()
+        lookup(symbol)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def bench_polygon():
+    import market
+    import polygon_stub
+    from polygon import RESTClient
+
+    server, base_url = polygon_stub.start_in_background()
+    market.polygon_api_key = "stub"
+    market.POLYGON_BASE_URL = base_url
+    market.polygon_client = None
+    symbols = polygon_stub.SYMBOLS * 10
+
+    def new_client_lookup(symbol):
+        return RESTClient("stub", base=base_url).get_snapshot_ticker("stocks", symbol)
+
+    def shared_client_lookup(symbol):
+        return market.get_polygon_client().get_snapshot_ticker("stocks", symbol)
+
+    shared_client_lookup("SPY")
+    before = time_lookups(new_client_lookup, symbols)
+    after = time_lookups(shared_client_lookup, symbols)
+    server.shutdown()
+
+    print(f"polygon: {len(symbols)} snapshot lookups against a local stub server")
+    for label, timings in (("new client per lookup", before), ("shared client", after)):
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"  {label}: mean {statistics.mean(timings):.2f} ms, p95 {p95:.2f} ms")
+
+
+def bench_accounts():
+    """Stress test: threads trading on one account at once must leave it consistent with its transactions"""
+    import random
+    import market
+    from accounts import Account, INITIAL_BALANCE, account_write_stats
+    from database import StaleAccountError
+
+    market.polygon_api_key = None
+    symbols = ["AAPL", "MSFT", "NVDA"]
+    counts = {"trades": 0, "rejected": 0, "gave up": 0}
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(OPS_PER_THREAD // 10):
+            symbol, quantity = random.choice(symbols), random.randint(1, 3)
+            account = Account.get("stress")
+            try:
+                if random.random() < 0.6:
+                    account.buy_shares(symbol, quantity, "stress")
+                else:
+                    account.sell_shares(symbol, quantity, "stress")
+                outcome = "trades"
+            except ValueError:
+                outcome = "rejected"
+            except StaleAccountError:
+                outcome = "gave up"
+            with lock:
+                counts[outcome] += 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB = os.path.join(tmp, "stress.db")
+        database.create_tables()
+        Account.get("stress").reset("stress")
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        account = Account.get("stress")
+
+    held = {}
+    for transaction in account.transactions:
+        held[transaction.symbol] = held.get(transaction.symbol, 0) + transaction.quantity
+    problems = account.check_aggregates()
+    if len(account.transactions) != counts["trades"]:
+        problems.append(f"{counts['trades']} trades completed but {len(account.transactions)} were recorded")
+    if {symbol: quantity for symbol, quantity in held.items() if quantity} != account.holdings:
+        problems.append(f"holdings {account.holdings} don't match the transactions {held}")
+    expected_balance = INITIAL_BALANCE - sum(transaction.total() for transaction in account.transactions)
+    if abs(account.balance - expected_balance) > 1e-6:
+        problems.append(f"balance {account.balance} doesn't match the transactions ({expected_balance})")
+
+    print(f"accounts: {THREADS} threads trading on one {database.ACCOUNT_STORAGE} account for {elapsed:.1f}s")
+    print(f"  {counts['trades']} trades, {counts['rejected']} rejected, {counts['gave up']} gave up after retries")
+    print(f"  {account_write_stats['conflicts']} write conflicts retried")
+    print("  consistent" if not problems else "  INCONSISTENT: " + "; ".join(problems))
+    # Fail the run, so a script or CI job running the stress test notices
+    if problems:
+        raise AssertionError(f"{database.ACCOUNT_STORAGE} account inconsistent after concurrent trading")
+
+
+def bench_projections():
+    """Per-call latency of the get_balance and get_holdings tools on an account with 10k transactions"""
+    import asyncio
+    import accounts_server
+    from accounts import Account
+
+    transactions = [
+        {"symbol": "AAPL", "quantity": 1, "price": 100.0, "timestamp": "2025-01-01 10:00:00", "rationale": "bench"}
+    ] * 10_000
+    account = sample_account | {"holdings": {"AAPL": 10_000}, "transactions": transactions}
+
+    def full_load(tool):
+        return lambda: getattr(Account.get("bench"), tool.removeprefix("get_"))
+
+    def tool_call(tool):
+        return lambda: asyncio.run(accounts_server.mcp.call_tool(tool, {"name": "bench"}))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB = os.path.join(tmp, "projections.db")
+        database.create_tables()
+        database.write_account("bench", account)
+        print(f"projections: tool calls on a {database.ACCOUNT_STORAGE} account with 10k transactions")
+        for tool in ("get_balance", "get_holdings"):
+            for label, call in (("Account.get", full_load(tool)), ("tool call", tool_call(tool))):
+                timings = time_lookups(lambda _: call(), range(50))
+                print(f"  {tool} via {label}: mean {statistics.mean(timings):.2f} ms")
+        database.write_account("bench", Account.get("bench").model_dump())
+        timings = time_lookups(lambda _: tool_call("get_holdings")(), range(1))
+        print(f"  get_holdings tool call just after a write: {timings[0]:.2f} ms")
+
+
+def bench_models():
+    """New connections opened by a simulated trading cycle's model calls, with the SDK's pool settings and the registry's"""
+    import asyncio
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from openai._constants import DEFAULT_CONNECTION_LIMITS
+    from model_registry import ModelRegistry, get_provider
+
+    traders, calls, gap_seconds = 4, 3, 6.0  # the gap, standing in for tool calls, outlasts httpx's 5s keep-alive
+    completion = json.dumps({
+        "id": "bench", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Hold"}}],
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(completion)))
+            self.end_headers()
+            self.wfile.write(completion)
+
+        def log_message(self, *args):
+            pass
+
+    async def cycle(registry: ModelRegistry):
+        async def run(index):
+            client = registry.get_client(get_provider("deepseek-chat"))
+            for call in range(calls):
+                if call:
+                    await asyncio.sleep(gap_seconds)
+                await client.chat.completions.create(model="deepseek-chat", messages=[{"role": "user", "content": "Trade"}])
+        await asyncio.gather(*(run(index) for index in range(traders)))
+        return registry.report()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    providers = {"deepseek": (f"http://127.0.0.1:{server.server_port}/v1", "bench")}
+    print(f"models: {traders} traders making {calls} model calls each, {gap_seconds:.0f}s apart; over https each new connection is a TLS handshake")
+    for label, registry in (
+        ("SDK default pool", ModelRegistry(providers, limits=DEFAULT_CONNECTION_LIMITS, concurrency={})),
+        ("model registry", ModelRegistry(providers, concurrency={})),
+    ):
+        print(f"  {label}: {asyncio.run(cycle(registry))}")
+    server.shutdown()
+
+
+benchmarks = {
+    "database": bench_database,
+    "polygon": bench_polygon,
+    "accounts": bench_accounts,
+    "projections": bench_projections,
+    "models": bench_models,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
@@ -0,0 +1,60 @@
+"""
+A publish/subscribe feed of changes to accounts and their logs, for the dashboard.
+
+The traders write to accounts.db from other processes, so there are no in-process events to
+hook into. One background thread instead checks every account's change markers with a single
+query each interval (see database.read_change_markers) and notifies subscribers only of the
+accounts and logs that actually changed, however many browser tabs are watching.
+"""
+
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from database import read_change_markers
+
+load_dotenv(override=True)
+
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "0.5"))
+
+
+class ChangeFeed:
+    def __init__(self, names: list[str], poll_seconds: float = CHANGE_FEED_POLL_SECONDS):
+        self.names = [name.lower() for name in names]
+        self.poll_seconds = poll_seconds
+        self.markers = {}
+        self.subscribers = []
+        self.thread = None
+
+    def subscribe(self, callback):
+        """Call callback(name, kind) from the feed's thread, where kind is "account" or "log", after each change"""
+        self.subscribers.append(callback)
+
+    def publish(self, name: str, kind: str):
+        for callback in self.subscribers:
+            try:
+                callback(name, kind)
+            except Exception as e:
+                print(f"Change feed subscriber failed on {kind} change for {name}: {e}")
+
+    def poll(self):
+        for name, (account_marker, log_marker) in read_change_markers(self.names).items():
+            previous_account, previous_log = self.markers.get(name, (None, None))
+            self.markers[name] = (account_marker, log_marker)
+            if account_marker != previous_account:
+                self.publish(name, "account")
+            if log_marker != previous_log:
+                self.publish(name, "log")
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Change feed poll failed: {e}")
+            time.sleep(self.poll_seconds)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
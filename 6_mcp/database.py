@@ -1,101 +1,825 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
 DB = "accounts.db"
 
+# Connection tuning: WAL lets readers (the UI) proceed while a trader writes, NORMAL
+# synchronous skips the fsync on every commit, and the busy timeout makes concurrent
+# writers wait for the lock instead of failing with "database is locked"
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").strip().upper()
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            datetime DATETIME,
-            type TEXT,
-            message TEXT
-        )
-    ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Unsupported DB_SYNCHRONOUS level {DB_SYNCHRONOUS}")
+
+# "json" stores each account as one document in accounts.account; "normalized" keeps the
+# balance and strategy on the accounts row and appends trades and portfolio values to their
+# own tables, so a trade costs the same however old the account is
+ACCOUNT_STORAGE = os.getenv("ACCOUNT_STORAGE", "json").strip().lower()
+
+if ACCOUNT_STORAGE not in ("json", "normalized"):
+    raise ValueError(f"Unsupported ACCOUNT_STORAGE {ACCOUNT_STORAGE}")
+
+# LogWriter batching: flush when this many entries are queued, or after this many seconds
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1.0"))
+
+# How often queue-mode workers write their heartbeat; the dashboard flags workers that have gone quiet
+WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "10"))
+
+_local = threading.local()
+
+# Projections of accounts read by read_balance and read_holdings, keyed by (name, field) and held
+# with the account version they were read at; every account write bumps the version, so an
+# entry is only used until the account is next written, by this process or any other
+projection_cache: dict[tuple[str, str], tuple[int, object]] = {}
+
+
+class StaleAccountError(Exception):
+    """Raised when an account write is based on a version that someone else has since replaced"""
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the long-lived connection for the current thread, opening it on first use.
+
+    Connections are reused per thread; asyncio tasks share their loop's thread, which is
+    safe because every call below runs to completion without awaiting.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.db != DB:
+        conn = sqlite3.connect(DB, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        _local.conn, _local.db, _local.depth = conn, DB, 0
+    return conn
+
+
+def close_connection():
+    """Close the current thread's connection, if it has one"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements in one write transaction and yield a cursor.
+
+    Nested uses join the outermost transaction, which commits on success and rolls
+    back if anything inside raises.
+    """
+    conn = get_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn.cursor()
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.depth = 0
+
+
+@contextmanager
+def snapshot():
+    """
+    Run the enclosed reads in one read transaction and yield a cursor, so they all see the
+    database as it was at the first of them, whatever is committed meanwhile.
+
+    Inside transaction(), the reads just join the write transaction.
+    """
+    conn = get_connection()
+    if _local.depth:
+        yield conn.cursor()
+        return
+    conn.execute("BEGIN")
+    _local.depth = 1
+    try:
+        yield conn.cursor()
+    finally:
+        _local.depth = 0
+        conn.execute("COMMIT")
+
+
+def create_tables():
+    with transaction() as cursor:
+        cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                datetime DATETIME,
+                type TEXT,
+                message TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_datetime ON logs (name, datetime)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
         cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+            CREATE TABLE IF NOT EXISTS market_prices (
+                date TEXT,
+                symbol TEXT,
+                close REAL,
+                PRIMARY KEY (date, symbol)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_prices_symbol ON market_prices (symbol, date)')
+        # For each day prices were looked up, the trading day whose closes were the latest then
+        cursor.execute('CREATE TABLE IF NOT EXISTS market_loads (date TEXT PRIMARY KEY, close_date TEXT)')
+        # Unpack the whole-market JSON snapshots of the legacy market table into one row per symbol,
+        # then drop it, so the unpacking happens once rather than on every import
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'")
+        if cursor.fetchone():
+            cursor.execute('''
+                INSERT OR IGNORE INTO market_prices (date, symbol, close)
+                SELECT market.date, prices.key, prices.value FROM market, json_each(market.data) AS prices
+                WHERE NOT EXISTS (SELECT 1 FROM market_prices WHERE market_prices.date = market.date)
+            ''')
+            cursor.execute('DROP TABLE market')
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(accounts)')}
+        if "balance" not in columns:
+            cursor.execute('ALTER TABLE accounts ADD COLUMN balance REAL')
+        if "strategy" not in columns:
+            cursor.execute('ALTER TABLE accounts ADD COLUMN strategy TEXT')
+        if "total_spend" not in columns:
+            cursor.execute('ALTER TABLE accounts ADD COLUMN total_spend REAL')
+        if "realized_pnl" not in columns:
+            cursor.execute('ALTER TABLE accounts ADD COLUMN realized_pnl REAL')
+        if "version" not in columns:
+            cursor.execute('ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS holdings (
+                name TEXT,
+                symbol TEXT,
+                quantity INTEGER,
+                PRIMARY KEY (name, symbol)
+            )
+        ''')
+        if "cost" not in {row[1] for row in cursor.execute('PRAGMA table_info(holdings)')}:
+            cursor.execute('ALTER TABLE holdings ADD COLUMN cost REAL')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                symbol TEXT,
+                quantity INTEGER,
+                price REAL,
+                timestamp TEXT,
+                rationale TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name ON transactions (name, id)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_values (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                datetime TEXT,
+                value REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_name ON portfolio_values (name, id)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_value_bars (
+                name TEXT,
+                start TEXT,
+                resolution TEXT,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                PRIMARY KEY (name, resolution, start)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT,
+                status TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                created DATETIME,
+                updated DATETIME,
+                error TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS workers (name TEXT PRIMARY KEY, heartbeat REAL, job_id INTEGER)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                trace_id TEXT,
+                name TEXT,
+                model TEXT,
+                type TEXT,
+                span_name TEXT,
+                started TEXT,
+                duration REAL,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                tool_calls INTEGER,
+                error TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_started ON metrics (started)')
+
+
+def migrate_accounts():
+    """Move every account still stored as a JSON document into the normalized tables"""
+    with transaction() as cursor:
+        cursor.execute('SELECT name, account FROM accounts WHERE balance IS NULL AND account IS NOT NULL')
+        for name, account_json in cursor.fetchall():
+            write_normalized_account(cursor, name, json.loads(account_json))
+
+
+def write_normalized_account(cursor, name, account_dict):
+    """Replace every row belonging to the account with the contents of account_dict"""
+    name = name.lower()
+    cursor.execute('''
+        INSERT INTO accounts (name, account, balance, strategy, total_spend, realized_pnl)
+        VALUES (?, NULL, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET account=NULL, balance=excluded.balance, strategy=excluded.strategy,
+            total_spend=excluded.total_spend, realized_pnl=excluded.realized_pnl
+    ''', (name, account_dict["balance"], account_dict["strategy"],
+          account_dict.get("total_spend"), account_dict.get("realized_pnl")))
+    for table in ("holdings", "transactions"):
+        cursor.execute(f'DELETE FROM {table} WHERE name = ?', (name,))
+    cost_basis = account_dict.get("cost_basis", {})
+    cursor.executemany(
+        'INSERT INTO holdings (name, symbol, quantity, cost) VALUES (?, ?, ?, ?)',
+        [(name, symbol, quantity, cost_basis.get(symbol)) for symbol, quantity in account_dict["holdings"].items()],
+    )
+    cursor.executemany(
+        'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+        [(name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in account_dict["transactions"]],
+    )
+    write_normalized_portfolio_series(
+        cursor, name, account_dict["portfolio_value_time_series"], account_dict.get("portfolio_value_bars", [])
+    )
+
+
+def write_normalized_portfolio_series(cursor, name, points, bars):
+    for table in ("portfolio_values", "portfolio_value_bars"):
+        cursor.execute(f'DELETE FROM {table} WHERE name = ?', (name,))
+    cursor.executemany(
+        'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)',
+        [(name, when, value) for when, value in points],
+    )
+    cursor.executemany(
+        'INSERT INTO portfolio_value_bars (name, start, resolution, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(name, *bar) for bar in bars],
+    )
+
+
+def read_normalized_account(cursor, name, version):
+    cursor.execute('SELECT balance, strategy, total_spend, realized_pnl FROM accounts WHERE name = ?', (name,))
+    balance, strategy, total_spend, realized_pnl = cursor.fetchone()
+    cursor.execute('SELECT symbol, quantity, cost FROM holdings WHERE name = ?', (name,))
+    rows = cursor.fetchall()
+    holdings = {symbol: quantity for symbol, quantity, _ in rows}
+    cursor.execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id
+    ''', (name,))
+    columns = ("symbol", "quantity", "price", "timestamp", "rationale")
+    transactions = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    cursor.execute('SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY id', (name,))
+    points = cursor.fetchall()
+    cursor.execute('''
+        SELECT start, resolution, open, high, low, close FROM portfolio_value_bars
+        WHERE name = ?
+        ORDER BY start
+    ''', (name,))
+    account = {
+        "name": name,
+        "balance": balance,
+        "strategy": strategy,
+        "holdings": holdings,
+        "transactions": transactions,
+        "portfolio_value_time_series": points,
+        "portfolio_value_bars": cursor.fetchall(),
+        "version": version,
+    }
+    # Accounts saved before the running aggregates existed have them rebuilt by Account.get
+    if total_spend is not None:
+        account["cost_basis"] = {symbol: cost for symbol, _, cost in rows}
+        account["total_spend"] = total_spend
+        account["realized_pnl"] = realized_pnl
+    return account
+
+
+create_tables()
+if ACCOUNT_STORAGE == "normalized":
+    migrate_accounts()
+
+def claim_version(cursor, name, expected_version) -> int:
+    """
+    Check that the account is still at expected_version and return the version the write in progress
+    will give it. Must be called inside transaction(), whose write lock keeps the check valid until commit.
+    A write with no expected_version, such as creating the account, is unconditional.
+    """
+    cursor.execute('SELECT version FROM accounts WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    version = row[0] if row else 0
+    if expected_version is not None and expected_version != version:
+        raise StaleAccountError(f"Account {name} is at version {version}, not {expected_version}")
+    return version + 1
+
+def write_account(name, account_dict) -> int:
+    """
+    Write the whole account, provided it is still at account_dict["version"] when given, and return its new version.
+
+    Raises:
+        StaleAccountError: If the account has been written since that version was read
+    """
+    name = name.lower()
+    account_dict = dict(account_dict)
+    expected_version = account_dict.pop("version", None)
+    with transaction() as cursor:
+        version = claim_version(cursor, name, expected_version)
+        if ACCOUNT_STORAGE == "normalized":
+            write_normalized_account(cursor, name, account_dict)
+        else:
+            cursor.execute('''
+                INSERT INTO accounts (name, account)
+                VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET account=excluded.account, balance=NULL, strategy=NULL
+            ''', (name, json.dumps(account_dict)))
+        cursor.execute('UPDATE accounts SET version = ? WHERE name = ?', (version, name))
+    return version
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
+    name = name.lower()
+    # A normalized account is read in several queries, which must all see the same version of it
+    with snapshot() as cursor:
+        cursor.execute('SELECT account, balance, version FROM accounts WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        account_json, balance, version = row
+        if balance is not None:
+            return read_normalized_account(cursor, name, version)
+    return json.loads(account_json) | {"version": version}
+
+def read_projection(name, field: str, read):
+    """Return read(cursor, name, is_json) for the account, or the cached value if the account is unchanged since"""
+    name = name.lower()
+    # The value is cached against the version, so both must be read from the same snapshot
+    with snapshot() as cursor:
+        cursor.execute('SELECT version, balance IS NULL FROM accounts WHERE name = ?', (name,))
         row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+        if not row:
+            return None
+        version, is_json = row
+        cached = projection_cache.get((name, field))
+        if cached and cached[0] == version:
+            return cached[1]
+        value = read(cursor, name, is_json)
+    projection_cache[(name, field)] = (version, value)
+    return value
+
+def read_balance_projection(cursor, name, is_json) -> float:
+    if is_json:
+        cursor.execute("SELECT json_extract(account, '$.balance') FROM accounts WHERE name = ?", (name,))
+    else:
+        cursor.execute('SELECT balance FROM accounts WHERE name = ?', (name,))
+    return cursor.fetchone()[0]
+
+def read_holdings_projection(cursor, name, is_json) -> dict[str, int]:
+    if is_json:
+        cursor.execute("SELECT json_extract(account, '$.holdings') FROM accounts WHERE name = ?", (name,))
+        return json.loads(cursor.fetchone()[0])
+    cursor.execute('SELECT symbol, quantity FROM holdings WHERE name = ?', (name,))
+    return dict(cursor.fetchall())
+
+def read_balance(name) -> float | None:
+    """Read just the cash balance of an account, without loading the rest of it; None if there's no such account"""
+    return read_projection(name, "balance", read_balance_projection)
+
+def read_holdings(name) -> dict[str, int] | None:
+    """Read just the holdings of an account, without loading the rest of it; None if there's no such account"""
+    holdings = read_projection(name, "holdings", read_holdings_projection)
+    return None if holdings is None else dict(holdings)
+
+def write_account_details(name, balance: float, strategy: str, expected_version: int) -> int:
+    """Update only the balance and strategy of a normalized account, and return its new version"""
+    name = name.lower()
+    with transaction() as cursor:
+        version = claim_version(cursor, name, expected_version)
+        cursor.execute(
+            'UPDATE accounts SET balance = ?, strategy = ?, version = ? WHERE name = ?',
+            (balance, strategy, version, name),
+        )
+    return version
+
+def write_trades(name, totals: dict, holdings: dict, transaction_dicts: list[dict], expected_version: int) -> int:
+    """
+    Record one or more trades on a normalized account by appending their transaction rows.
+
+    Args:
+        name (str): The account name
+        totals (dict): The balance, total_spend and realized_pnl after the trades
+        holdings (dict): For each symbol traded, its (quantity held, cost basis) after the trades
+        transaction_dicts (list[dict]): The dumped Transactions
+        expected_version (int): The version of the account the trades were applied to
+
+    Returns:
+        int: The new version of the account
+
+    Raises:
+        StaleAccountError: If the account has been written since expected_version
+    """
+    name = name.lower()
+    with transaction() as cursor:
+        version = claim_version(cursor, name, expected_version)
+        cursor.execute(
+            'UPDATE accounts SET balance = ?, total_spend = ?, realized_pnl = ?, version = ? WHERE name = ?',
+            (totals["balance"], totals["total_spend"], totals["realized_pnl"], version, name),
+        )
+        held = [(name, symbol, quantity, cost) for symbol, (quantity, cost) in holdings.items() if quantity]
+        cursor.executemany('''
+            INSERT INTO holdings (name, symbol, quantity, cost) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, cost=excluded.cost
+        ''', held)
+        cursor.executemany(
+            'DELETE FROM holdings WHERE name = ? AND symbol = ?',
+            [(name, symbol) for symbol, (quantity, _) in holdings.items() if not quantity],
+        )
+        cursor.executemany(
+            'INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale) VALUES (?, ?, ?, ?, ?, ?)',
+            [(name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in transaction_dicts],
+        )
+    return version
+
+def write_portfolio_series(name, point: tuple, bars: list, kept_from: str, expected_version: int) -> int:
+    """
+    Save a normalized account's portfolio value series after appending point and compacting, and return
+    its new version: replace the bars, delete the points before kept_from, which compaction has rolled
+    into them, and append the new point.
+
+    Points from kept_from on are left in place rather than rewritten. Appending a point doesn't bump
+    the version, so another process may have appended one since this account was read, and it must survive.
+    """
+    name = name.lower()
+    with transaction() as cursor:
+        version = claim_version(cursor, name, expected_version)
+        cursor.execute('DELETE FROM portfolio_values WHERE name = ? AND datetime < ?', (name, kept_from))
+        cursor.execute('DELETE FROM portfolio_value_bars WHERE name = ?', (name,))
+        cursor.executemany(
+            'INSERT INTO portfolio_value_bars (name, start, resolution, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(name, *bar) for bar in bars],
+        )
+        cursor.execute('INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)', (name, *point))
+        cursor.execute('UPDATE accounts SET version = ? WHERE name = ?', (version, name))
+    return version
+
+def write_portfolio_value(name, datetime: str, value: float):
+    """Append one point to a normalized account's portfolio value time series"""
+    with transaction() as cursor:
+        cursor.execute(
+            'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)',
+            (name.lower(), datetime, value),
+        )
+
 def write_log(name: str, type: str, message: str):
     """
     Write a log entry to the logs table.
-    
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
+    with transaction() as cursor:
         cursor.execute('''
             INSERT INTO logs (name, datetime, type, message)
             VALUES (?, datetime('now'), ?, ?)
         ''', (name.lower(), type, message))
-        conn.commit()
+
+class LogWriter:
+    """
+    Queues log entries in memory and writes them to the logs table in batches.
+
+    write() only appends to a list, so it is cheap to call from the event loop; a
+    background thread flushes the queue every flush_seconds, or sooner once batch_size
+    entries are waiting. Call shutdown() on exit so that nothing queued is lost.
+    """
+
+    insert = 'INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)'
+
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_seconds: float = LOG_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def write(self, name: str, type: str, message: str):
+        # Same format and timezone as SQLite's datetime('now'), captured when the entry is queued
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self.queue((name.lower(), now, type, message))
+
+    def queue(self, row: tuple):
+        with self.lock:
+            self.pending.append(row)
+            full = len(self.pending) >= self.batch_size
+            if self.thread is None and not self.stopped:
+                self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+                self.thread.start()
+        if full:
+            self.wake.set()
+
+    def run(self):
+        while not self.stopped:
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Unable to write {type(self).__name__} batch due to {e}; will retry")
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                with transaction() as cursor:
+                    cursor.executemany(self.insert, batch)
+            except sqlite3.Error:
+                with self.lock:
+                    self.pending = batch + self.pending
+                raise
+
+    def shutdown(self):
+        with self.lock:
+            self.stopped = True
+            thread = self.thread
+        self.wake.set()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+class MetricsWriter(LogWriter):
+    """Queues span metrics and writes them to the metrics table in batches, like LogWriter"""
+
+    insert = '''
+        INSERT INTO metrics (trace_id, name, model, type, span_name, started, duration, input_tokens, output_tokens, tool_calls, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def write(self, trace_id: str, name: str, model: str | None, type: str, span_name: str | None, started: str,
+              duration: float, input_tokens: int = 0, output_tokens: int = 0, tool_calls: int = 0, error: str | None = None):
+        self.queue((trace_id, name.lower(), model, type, span_name, started, duration, input_tokens, output_tokens, tool_calls, error))
+
+def read_metrics(since: str) -> list[tuple]:
+    """
+    Read the span metrics recorded since the given UTC time.
+
+    Returns:
+        list: (trace_id, name, model, type, span_name, started, duration, input_tokens, output_tokens, tool_calls, error) tuples
+    """
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT trace_id, name, model, type, span_name, started, duration, input_tokens, output_tokens, tool_calls, error
+        FROM metrics WHERE started >= ? ORDER BY id
+    ''', (since,))
+    return cursor.fetchall()
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
-
-def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY datetime DESC, id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+
+    return reversed(cursor.fetchall())
+
+def read_log_since(name: str, last_id: int = 0, last_n=100):
+    """
+    Read the log entries for a given name written after the entry with id last_id.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_id (int): The id of the last entry already seen, or 0 for none
+        last_n (int): The most entries to return; older ones are skipped if there are more
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_id, last_n))
+
+    return list(reversed(cursor.fetchall()))
+
+def read_change_markers(names: list[str]) -> dict[str, tuple[tuple, int]]:
+    """
+    Read markers that show whether accounts or their logs have changed, with one query.
+
+    Returns:
+        dict: For each account name, ((version, id of the last portfolio value point), id of the last log entry);
+        the first changes whenever the account is written, and the second whenever a log entry is added for it
+    """
+    cursor = get_connection().cursor()
+    placeholders = ",".join("?" * len(names))
+    cursor.execute(f'''
+        SELECT name, version,
+            (SELECT MAX(id) FROM portfolio_values WHERE portfolio_values.name = accounts.name),
+            (SELECT MAX(id) FROM logs WHERE logs.name = accounts.name)
+        FROM accounts WHERE name IN ({placeholders})
+    ''', [name.lower() for name in names])
+    return {name: ((version, last_point), last_log or 0) for name, version, last_point, last_log in cursor.fetchall()}
+
+def write_market_prices(date: str, prices: dict[str, float]) -> None:
+    """Store the closing price of every symbol for a date, one row per symbol"""
+    with transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO market_prices (date, symbol, close)
+            VALUES (?, ?, ?)
+            ON CONFLICT(date, symbol) DO UPDATE SET close=excluded.close
+        ''', [(date, symbol, close) for symbol, close in prices.items()])
+
+def has_market_prices(date: str) -> bool:
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT 1 FROM market_prices WHERE date = ? LIMIT 1', (date,))
+    return cursor.fetchone() is not None
+
+def write_market_load(date: str, close_date: str) -> None:
+    """Record that on date, the latest closing prices were those of close_date"""
+    with transaction() as cursor:
+        cursor.execute(
+            'INSERT INTO market_loads (date, close_date) VALUES (?, ?) ON CONFLICT(date) DO UPDATE SET close_date=excluded.close_date',
+            (date, close_date),
+        )
+
+def read_market_load(date: str) -> str | None:
+    """The trading day whose closing prices were the latest on date, if they've been loaded"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT close_date FROM market_loads WHERE date = ?', (date,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def read_market_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """Return the prices stored for a date, for just the given symbols"""
+    cursor = get_connection().cursor()
+    placeholders = ",".join("?" * len(symbols))
+    cursor.execute(
+        f'SELECT symbol, close FROM market_prices WHERE date = ? AND symbol IN ({placeholders})',
+        (date, *symbols),
+    )
+    return dict(cursor.fetchall())
+
+def read_price_history(symbols: list[str], start_date: str | None = None, end_date: str | None = None) -> list[tuple[str, str, float]]:
+    """
+    Read the stored closing prices of some symbols over a range of dates.
+
+    Args:
+        symbols (list[str]): The symbols to retrieve
+        start_date (str): The first date to include, as YYYY-MM-DD, or None for the earliest
+        end_date (str): The last date to include, as YYYY-MM-DD, or None for the latest
+
+    Returns:
+        list: A list of tuples containing (date, symbol, close), ordered by date
+    """
+    cursor = get_connection().cursor()
+    placeholders = ",".join("?" * len(symbols))
+    cursor.execute(f'''
+        SELECT date, symbol, close FROM market_prices
+        WHERE symbol IN ({placeholders}) AND date >= ? AND date <= ?
+        ORDER BY date, symbol
+    ''', (*symbols, start_date or "", end_date or "9999-12-31"))
+    return cursor.fetchall()
+
+
+# A durable job queue for worker mode. A job is queued, then running under a lease held by
+# one worker, which must keep renewing it; a job whose lease expires, or that fails, is
+# queued again until it has been attempted max_attempts times, and then marked failed.
+
+def enqueue_job(payload: dict) -> int:
+    with transaction() as cursor:
         cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
-
-def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
+            INSERT INTO jobs (payload, status, created, updated)
+            VALUES (?, 'queued', datetime('now'), datetime('now'))
+        ''', (json.dumps(payload),))
+        return cursor.lastrowid
+
+def requeue_expired_jobs(cursor, max_attempts: int):
+    cursor.execute('''
+        UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+            worker = NULL, error = 'Lease expired', updated = datetime('now')
+        WHERE status = 'running' AND lease_expires < ?
+    ''', (max_attempts, time.time()))
+
+def claim_job(worker: str, lease_seconds: float, max_attempts: int) -> tuple[int, dict, int] | None:
+    """
+    Lease the oldest queued job to the worker, first requeueing any job whose lease has expired.
+
+    Returns:
+        tuple: (job id, payload, attempt number), or None if no job is queued
+    """
+    with transaction() as cursor:
+        requeue_expired_jobs(cursor, max_attempts)
+        cursor.execute("SELECT id, payload, attempts FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
         row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+        if not row:
+            return None
+        job_id, payload, attempts = row
+        cursor.execute('''
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?,
+                updated = datetime('now')
+            WHERE id = ?
+        ''', (worker, time.time() + lease_seconds, job_id))
+        return job_id, json.loads(payload), attempts + 1
+
+def renew_job_lease(job_id: int, worker: str, lease_seconds: float) -> bool:
+    """Extend the worker's lease on a job; False if the worker no longer holds it"""
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (time.time() + lease_seconds, job_id, worker))
+        return cursor.rowcount == 1
+
+def complete_job(job_id: int, worker: str):
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE jobs SET status = 'done', lease_expires = NULL, updated = datetime('now')
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (job_id, worker))
+
+def fail_job(job_id: int, worker: str, error: str, max_attempts: int):
+    """Queue the job for another attempt, or mark it failed if it has had max_attempts"""
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                worker = NULL, lease_expires = NULL, error = ?, updated = datetime('now')
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (max_attempts, error, job_id, worker))
+
+def has_pending_job(key: str, value) -> bool:
+    """True if a queued or running job has this value in its payload"""
+    cursor = get_connection().cursor()
+    cursor.execute(f'''
+        SELECT 1 FROM jobs WHERE status IN ('queued', 'running') AND json_extract(payload, '$.{key}') = ? LIMIT 1
+    ''', (value,))
+    return cursor.fetchone() is not None
+
+def write_worker_heartbeat(worker: str, job_id: int | None):
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO workers (name, heartbeat, job_id) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET heartbeat=excluded.heartbeat, job_id=excluded.job_id
+        ''', (worker, time.time(), job_id))
+
+def read_job_counts() -> dict[str, int]:
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')
+    return dict(cursor.fetchall())
+
+def read_workers() -> list[tuple[str, float, int | None]]:
+    """Return (name, seconds since last heartbeat, current job id) for every worker seen, most recent first"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT name, ? - heartbeat, job_id FROM workers ORDER BY heartbeat DESC', (time.time(),))
+    return cursor.fetchall()
@@ -1,10 +1,14 @@
 from polygon import RESTClient
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+import urllib3
+import certifi
 import os
 from datetime import datetime
 import random
-from database import write_market, read_market
-from functools import lru_cache
+import threading
+import time
+from database import write_market_prices, has_market_prices, read_market_prices, write_market_load, read_market_load
 from datetime import timezone
 
 load_dotenv(override=True)
@@ -15,56 +19,157 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# One RESTClient is shared by every lookup so its pooled connections are kept alive between
+# calls; POLYGON_BASE_URL can point at a local polygon_stub.py server for tests
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_POOL_SIZE = int(os.getenv("POLYGON_POOL_SIZE", "10"))
+POLYGON_RETRIES = int(os.getenv("POLYGON_RETRIES", "5"))
+POLYGON_BACKOFF_SECONDS = float(os.getenv("POLYGON_BACKOFF_SECONDS", "0.5"))
+
+polygon_client = None
+polygon_client_lock = threading.Lock()
+
+# Prices fetched from Polygon are reused for this long before being looked up again
+PRICE_CACHE_TTL_SECONDS = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "60"))
+
+price_cache: dict[str, tuple[float, float]] = {}  # symbol -> (price, time fetched)
+price_cache_stats = {"hits": 0, "misses": 0}
+price_cache_lock = threading.Lock()
+
+# For each date whose end-of-day prices are already in the market_prices table, the trading day they closed on
+loaded_market_dates: dict[str, str] = {}
+
+
+def get_polygon_client() -> RESTClient:
+    """
+    Return the shared Polygon client, creating it on first use.
+
+    Its connection pool keeps up to POLYGON_POOL_SIZE connections per host alive, and
+    429s and 5xx responses are retried with exponential backoff, honouring Retry-After.
+    """
+    global polygon_client
+    with polygon_client_lock:
+        if polygon_client is None:
+            client = RESTClient(polygon_api_key, base=POLYGON_BASE_URL, retries=POLYGON_RETRIES)
+            retry_strategy = Retry(
+                total=POLYGON_RETRIES,
+                status_forcelist=[429, 500, 502, 503, 504],
+                backoff_factor=POLYGON_BACKOFF_SECONDS,
+                respect_retry_after_header=True,
+            )
+            client.client = urllib3.PoolManager(
+                maxsize=POLYGON_POOL_SIZE,
+                headers=client.headers,
+                ca_certs=certifi.where(),
+                cert_reqs="CERT_REQUIRED",
+                retries=retry_strategy,
+            )
+            polygon_client = client
+        return polygon_client
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
+    client = get_polygon_client()
     market_status = client.get_market_status()
     return market_status.market == "open"
 
 
-def get_all_share_prices_polygon_eod() -> dict[str, float]:
-    """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+def get_all_share_prices_polygon_eod() -> tuple[str, dict[str, float]]:
+    """
+    Return the date of the last trading session and every symbol's close in it.
+    With much thanks to student Reema R. for fixing the timezone issue with this!
+    """
+    client = get_polygon_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
 
     results = client.get_grouped_daily_aggs(last_close, adjusted=True, include_otc=False)
-    return {result.ticker: result.close for result in results}
-
-
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+    return last_close.strftime("%Y-%m-%d"), {result.ticker: result.close for result in results}
+
+
+def load_market_for_prior_date(today) -> str:
+    """
+    Make sure the prior session's closes are stored, under the date of that session, and return
+    that date. Which session was the prior one on each day is recorded too, so it's looked up once a day.
+    """
+    if today in loaded_market_dates:
+        return loaded_market_dates[today]
+    close_date = read_market_load(today)
+    if close_date is None:
+        close_date, prices = get_all_share_prices_polygon_eod()
+        if not has_market_prices(close_date):
+            write_market_prices(close_date, prices)
+        write_market_load(today, close_date)
+    loaded_market_dates[today] = close_date
+    return close_date
+
+
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    close_date = load_market_for_prior_date(today)
+    prices = read_market_prices(close_date, symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
 def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    return get_share_prices_polygon_eod([symbol])[symbol]
 
 
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
+    client = get_polygon_client()
     result = client.get_snapshot_ticker("stocks", symbol)
     return result.min.close or result.prev_day.close
 
 
-def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
-    else:
-        return get_share_price_polygon_eod(symbol)
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """Look up many symbols with a single snapshot request"""
+    client = get_polygon_client()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close or result.prev_day.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
-def get_share_price(symbol) -> float:
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if is_paid_polygon:
+        if len(symbols) == 1:
+            return {symbols[0]: get_share_price_polygon_min(symbols[0])}
+        return get_share_prices_polygon_min(symbols)
+    else:
+        return get_share_prices_polygon_eod(symbols)
+
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """Return the price of each symbol, using cached prices younger than PRICE_CACHE_TTL_SECONDS"""
+    now = time.monotonic()
+    prices = {}
+    with price_cache_lock:
+        for symbol in symbols:
+            cached = price_cache.get(symbol)
+            if cached and now - cached[1] < PRICE_CACHE_TTL_SECONDS:
+                prices[symbol] = cached[0]
+                price_cache_stats["hits"] += 1
+    missing = [symbol for symbol in dict.fromkeys(symbols) if symbol not in prices]
+    if not missing:
+        return prices
+    with price_cache_lock:
+        price_cache_stats["misses"] += len(missing)
     if polygon_api_key:
         try:
-            return get_share_price_polygon(symbol)
+            fetched = get_share_prices_polygon(missing)
+            with price_cache_lock:
+                for symbol, price in fetched.items():
+                    price_cache[symbol] = (price, now)
+            return prices | fetched
         except Exception as e:
             print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+    return prices | {symbol: float(random.randint(1, 100)) for symbol in missing}
+
+
+def get_share_price(symbol) -> float:
+    return get_share_prices([symbol])[symbol]
+
+
+def get_price_cache_stats() -> dict[str, int]:
+    with price_cache_lock:
+        return {**price_cache_stats, "size": len(price_cache)}
@@ -0,0 +1,113 @@
+"""
+When the US stock market is open, without asking Polygon on every scheduler tick.
+
+The regular session runs 9:30 to 16:00 New York time on weekdays, less the holidays and early
+closes that Polygon publishes. The open/closed status from Polygon is cached until the next
+session boundary, so the scheduler can sleep straight through to the next open. When Polygon
+disagrees with the schedule, as it does around the bell while it still reports extended hours,
+its answer is only kept for MARKET_STATUS_RETRY_SECONDS. If Polygon can't be reached, the status
+is worked out from the schedule alone.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+import market
+
+load_dotenv(override=True)
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+# Even between session boundaries, ask Polygon again after this long, to catch unscheduled closures
+MARKET_STATUS_MAX_AGE_SECONDS = float(os.getenv("MARKET_STATUS_MAX_AGE_SECONDS", "3600"))
+# When Polygon's status disagrees with the schedule, ask again this soon
+MARKET_STATUS_RETRY_SECONDS = float(os.getenv("MARKET_STATUS_RETRY_SECONDS", "60"))
+MARKET_HOLIDAYS_MAX_AGE_SECONDS = 24 * 3600
+
+
+class MarketCalendar:
+    def __init__(self):
+        self.holidays: dict[date, tuple[datetime, datetime] | None] = {}  # None when closed all day
+        self.holidays_fetched = None
+        self.status = None  # (is open, valid until)
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def refresh_holidays(self, now: datetime):
+        if self.holidays_fetched and (now - self.holidays_fetched).total_seconds() < MARKET_HOLIDAYS_MAX_AGE_SECONDS:
+            return
+        self.holidays_fetched = now
+        if not market.polygon_api_key:
+            return
+        try:
+            holidays = {}
+            for holiday in market.get_polygon_client().get_market_holidays():
+                if holiday.exchange != "NYSE":
+                    continue
+                day = date.fromisoformat(holiday.date)
+                if holiday.status == "early-close" and holiday.open and holiday.close:
+                    holidays[day] = (datetime.fromisoformat(holiday.open), datetime.fromisoformat(holiday.close))
+                else:
+                    holidays[day] = None
+            self.holidays = holidays
+        except Exception as e:
+            print(f"Couldn't fetch market holidays from Polygon ({e}); using the weekday schedule")
+
+    def session(self, day: date) -> tuple[datetime, datetime] | None:
+        """The open and close times of the session on this New York date, or None if there isn't one"""
+        if day in self.holidays:
+            return self.holidays[day]
+        if day.weekday() >= 5:
+            return None
+        return (
+            datetime.combine(day, MARKET_OPEN, MARKET_TIMEZONE),
+            datetime.combine(day, MARKET_CLOSE, MARKET_TIMEZONE),
+        )
+
+    def scheduled_status(self, now: datetime) -> tuple[bool, datetime]:
+        """Whether the schedule has the market open now, and when that next changes"""
+        day = now.astimezone(MARKET_TIMEZONE).date()
+        for offset in range(14):
+            session = self.session(day + timedelta(days=offset))
+            if session is None:
+                continue
+            open, close = session
+            if now < open:
+                return False, open
+            if now < close:
+                return True, close
+        return False, now + timedelta(days=1)
+
+    def is_open(self) -> bool:
+        now = self.now()
+        if self.status and now < self.status[1]:
+            return self.status[0]
+        self.refresh_holidays(now)
+        scheduled_open, boundary = self.scheduled_status(now)
+        is_open = scheduled_open
+        if market.polygon_api_key:
+            try:
+                is_open = market.is_market_open()
+            except Exception as e:
+                print(f"Couldn't fetch market status from Polygon ({e}); using the schedule")
+        max_age = MARKET_STATUS_MAX_AGE_SECONDS if is_open == scheduled_open else MARKET_STATUS_RETRY_SECONDS
+        valid_until = min(boundary, now + timedelta(seconds=max_age))
+        self.status = (is_open, valid_until)
+        return is_open
+
+    def seconds_until_open(self) -> float:
+        """How long to sleep until the market next opens; 0 if it's open now"""
+        if self.is_open():
+            return 0.0
+        now = self.now()
+        scheduled_open, boundary = self.scheduled_status(now)
+        # If Polygon says closed during scheduled hours, check again when the short-lived status expires
+        wake = self.status[1] if scheduled_open else boundary
+        return max((wake - now).total_seconds(), 1.0)
+
+
+market_calendar = MarketCalendar()
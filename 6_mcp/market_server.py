@@ -1,4 +1,5 @@
 from mcp.server.fastmcp import FastMCP
+from util import run_mcp_server
 from market import get_share_price
 
 mcp = FastMCP("market_server")
@@ -13,4 +14,4 @@ async def lookup_share_price(symbol: str) -> float:
     return get_share_price(symbol)
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    run_mcp_server(mcp)
\ No newline at end of file
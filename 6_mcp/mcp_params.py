@@ -19,25 +19,44 @@ else:
     market_mcp = {"command": "uv", "args": ["run", "market_server.py"]}
 
 
+# The servers that keep no per-trader state, launched locally for each trader by default.
+# Set <NAME>_MCP_URL (e.g. MARKET_MCP_URL) to the URL of one shared instance instead, as
+# started by shared_servers.py; a URL ending in /sse uses SSE, otherwise streamable HTTP
+
+stateless_mcp_server_params = {
+    "accounts": {"command": "uv", "args": ["run", "accounts_server.py"]},
+    "push": {"command": "uv", "args": ["run", "push_server.py"]},
+    "market": market_mcp,
+    "fetch": {"command": "uvx", "args": ["mcp-server-fetch"]},
+    "brave": {
+        "command": "npx",
+        "args": ["-y", "@modelcontextprotocol/server-brave-search"],
+        "env": brave_env,
+    },
+}
+
+
+def stateless_server_params(name: str) -> dict:
+    url = os.getenv(f"{name.upper()}_MCP_URL")
+    return {"url": url} if url else stateless_mcp_server_params[name]
+
+
 # The full set of MCP servers for the trader: Accounts, Push Notification and the Market
 
 trader_mcp_server_params = [
-    {"command": "uv", "args": ["run", "accounts_server.py"]},
-    {"command": "uv", "args": ["run", "push_server.py"]},
-    market_mcp,
+    stateless_server_params("accounts"),
+    stateless_server_params("push"),
+    stateless_server_params("market"),
 ]
 
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
+# Memory is per-trader, so it is always launched locally
 
 
 def researcher_mcp_server_params(name: str):
     return [
-        {"command": "uvx", "args": ["mcp-server-fetch"]},
-        {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-brave-search"],
-            "env": brave_env,
-        },
+        stateless_server_params("fetch"),
+        stateless_server_params("brave"),
         {
             "command": "npx",
             "args": ["-y", "mcp-memory-libsql"],
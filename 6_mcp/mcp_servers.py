@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+from contextlib import AbstractAsyncContextManager
+from typing import Callable
+from agents.mcp import MCPServer, MCPServerStdio, MCPServerSse, MCPServerStreamableHttp
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+MCP_HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT_SECONDS", "30"))
+
+
+def make_mcp_server(params: dict, client_session_timeout_seconds: float = 120) -> MCPServer:
+    """Create a server from its launch params, or from the url of a shared instance"""
+    if "url" not in params:
+        return MCPServerStdio(params, client_session_timeout_seconds=client_session_timeout_seconds)
+    elif params["url"].rstrip("/").endswith("/sse"):
+        return MCPServerSse(params, client_session_timeout_seconds=client_session_timeout_seconds)
+    else:
+        return MCPServerStreamableHttp(params, client_session_timeout_seconds=client_session_timeout_seconds)
+
+
+def describe(params: dict) -> str:
+    return params.get("url") or " ".join([params["command"], *params["args"]])
+
+
+class SessionOwner:
+    """
+    Opens a session in a background task of its own and holds it open until stopped.
+
+    The stdio transport must be entered and exited in the same task, so a session shared
+    between callers can't be opened by whichever of them needs it first. `ready` resolves
+    to the session once it's open, or to the error that stopped it opening.
+    """
+
+    def __init__(self, open: Callable[[], AbstractAsyncContextManager], label: str):
+        self.label = label
+        self.ready = asyncio.get_running_loop().create_future()
+        self.stop = asyncio.Event()
+        self.task = asyncio.create_task(self.run(open))
+
+    async def run(self, open: Callable[[], AbstractAsyncContextManager]):
+        try:
+            async with open() as session:
+                self.ready.set_result(session)
+                await self.stop.wait()
+        except Exception as e:
+            if not self.ready.done():
+                self.ready.set_exception(e)
+            else:
+                print(f"{self.label} stopped unexpectedly: {e}")
+
+    def running(self) -> bool:
+        """Whether the session opened and is still open"""
+        return self.ready.done() and self.ready.exception() is None and not self.task.done()
+
+    async def close(self):
+        self.stop.set()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+class MCPServerPool:
+    """
+    Starts each distinct MCP server once and keeps it connected across trading cycles.
+
+    Servers are keyed by their params, so servers with identical params (accounts, push,
+    market, fetch and search) are started once and shared by every trader, while those
+    with per-trader params, like each trader's memory, get one instance per trader.
+    Each server is held open by a SessionOwner.
+    """
+
+    def __init__(self, client_session_timeout_seconds: float = 120):
+        self.client_session_timeout_seconds = client_session_timeout_seconds
+        self.entries: dict[str, SessionOwner] = {}
+
+    def start(self, params: dict) -> SessionOwner:
+        return SessionOwner(
+            lambda: make_mcp_server(params, self.client_session_timeout_seconds), f"MCP server {describe(params)}"
+        )
+
+    async def get(self, params: dict) -> MCPServer:
+        """Return the connected server for these params, starting it if need be"""
+        key = json.dumps(params, sort_keys=True)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = self.start(params)
+        try:
+            # Shielded, as other traders may be waiting on the same server to start
+            return await asyncio.shield(entry.ready)
+        except Exception:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+            raise
+
+    async def get_all(self, params_list: list[dict]) -> list[MCPServer]:
+        return [await self.get(params) for params in params_list]
+
+    async def health_check(self):
+        """Drop any server that has died or stopped responding; it's restarted when next needed"""
+        for key, entry in list(self.entries.items()):
+            if not entry.ready.done():
+                continue
+            healthy = entry.running()
+            if healthy:
+                try:
+                    await asyncio.wait_for(entry.ready.result().list_tools(), MCP_HEALTH_CHECK_TIMEOUT_SECONDS)
+                except Exception as e:
+                    print(f"{entry.label} failed its health check: {e!r}")
+                    healthy = False
+            if not healthy:
+                entry.stop.set()
+                del self.entries[key]
+
+    async def close(self):
+        await asyncio.gather(*(entry.close() for entry in self.entries.values()))
+        self.entries = {}
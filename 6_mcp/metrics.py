@@ -0,0 +1,64 @@
+"""
+Report where the traders' runs spend their time and tokens, from the metrics MetricsTracer records.
+
+    uv run metrics.py [--hours 24]
+
+Shows the p50 and p95 duration of each span type overall, per trader and per model, and the
+p50 and p95 duration, tokens and tool calls of whole runs, over the given window.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from database import read_metrics
+
+COLUMNS = ["trace_id", "name", "model", "type", "span_name", "started", "duration", "input_tokens", "output_tokens", "tool_calls", "error"]
+
+
+def span_label(type: str, span_name: str | None) -> str:
+    """Group spans by type, but keep custom spans such as mcp_startup, and the Researcher sub-agent, apart"""
+    if type == "custom":
+        return span_name or type
+    if type in ("agent", "function") and span_name == "Researcher":
+        return f"{type}:Researcher"
+    return type
+
+
+def percentiles(df: pd.DataFrame, by: list[str], columns: list[str]) -> pd.DataFrame:
+    """Count, p50 and p95 of each column for each group"""
+    grouped = df.groupby(by)[columns]
+    summary = pd.concat(
+        {"p50": grouped.quantile(0.5), "p95": grouped.quantile(0.95)}, axis=1
+    ).swaplevel(axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+    summary.insert(0, "count", grouped.size())
+    return summary.round(2)
+
+
+def report(hours: float) -> str:
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+    df = pd.DataFrame(read_metrics(since), columns=COLUMNS)
+    if df.empty:
+        return f"No metrics recorded in the last {hours:g} hours"
+    df["model"] = df["model"].fillna("unknown")
+    df["tokens"] = df["input_tokens"] + df["output_tokens"]
+    df["span"] = [span_label(type, span_name) for type, span_name in zip(df["type"], df["span_name"])]
+    runs, spans = df[df["type"] == "trace"], df[df["type"] != "trace"]
+    sections = [
+        ("Runs per trader", percentiles(runs, ["name"], ["duration", "tokens", "tool_calls"])),
+        ("Runs per model", percentiles(runs, ["model"], ["duration", "tokens", "tool_calls"])),
+        ("Span durations (seconds) per type", percentiles(spans, ["span"], ["duration"])),
+        ("Span durations (seconds) per trader and type", percentiles(spans, ["name", "span"], ["duration"])),
+        ("Span durations (seconds) per model and type", percentiles(spans, ["model", "span"], ["duration"])),
+    ]
+    errors = spans["error"].notna().sum()
+    lines = [f"{len(runs)} runs and {len(spans)} spans in the last {hours:g} hours, {errors} spans with errors"]
+    for title, table in sections:
+        lines += ["", title, table.to_string() if len(table) else "(none)"]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=24, help="How far back to report on")
+    args = parser.parse_args()
+    print(report(args.hours))
@@ -0,0 +1,158 @@
+"""
+One model object per (provider, model name), shared by every agent of every trader run.
+
+All the providers' AsyncOpenAI clients share one httpx connection pool, with connections kept
+alive for MODEL_HTTP_KEEPALIVE_SECONDS, long enough to outlast the tool calls and research
+between a trader's model calls; httpx's default of 5 seconds means a fresh TLS handshake for
+most calls. PROVIDER_CONCURRENCY caps the calls in flight to each provider, like
+"openai=8,deepseek=2"; calls beyond the cap wait for one to finish.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+import httpx
+from agents import OpenAIChatCompletionsModel, OpenAIResponsesModel
+from agents.models.interface import Model
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from scheduler import parse_rate_limits
+
+load_dotenv(override=True)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+GROK_BASE_URL = "https://api.x.ai/v1"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Each provider's base url (None for OpenAI itself) and API key
+PROVIDERS = {
+    "openai": (None, os.getenv("OPENAI_API_KEY")),
+    "openrouter": (OPENROUTER_BASE_URL, os.getenv("OPENROUTER_API_KEY")),
+    "deepseek": (DEEPSEEK_BASE_URL, os.getenv("DEEPSEEK_API_KEY")),
+    "grok": (GROK_BASE_URL, os.getenv("GROK_API_KEY")),
+    "gemini": (GEMINI_BASE_URL, os.getenv("GOOGLE_API_KEY")),
+}
+
+MODEL_HTTP_MAX_CONNECTIONS = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "20"))
+MODEL_HTTP_KEEPALIVE_SECONDS = float(os.getenv("MODEL_HTTP_KEEPALIVE_SECONDS", "300"))
+PROVIDER_CONCURRENCY = os.getenv("PROVIDER_CONCURRENCY", "")
+
+MODEL_HTTP_LIMITS = httpx.Limits(
+    max_connections=MODEL_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=MODEL_HTTP_MAX_CONNECTIONS,
+    keepalive_expiry=MODEL_HTTP_KEEPALIVE_SECONDS,
+)
+
+
+def get_provider(model_name: str) -> str:
+    if "/" in model_name:
+        return "openrouter"
+    elif "deepseek" in model_name:
+        return "deepseek"
+    elif "grok" in model_name:
+        return "grok"
+    elif "gemini" in model_name:
+        return "gemini"
+    else:
+        return "openai"
+
+
+class CappedModel(Model):
+    """A model whose calls each take one of its provider's concurrency slots"""
+
+    def __init__(self, model: Model, registry: "ModelRegistry", provider: str):
+        self.model = model
+        self.registry = registry
+        self.provider = provider
+
+    async def get_response(self, *args, **kwargs):
+        async with self.registry.slot(self.provider):
+            return await self.model.get_response(*args, **kwargs)
+
+    async def stream_response(self, *args, **kwargs):
+        async with self.registry.slot(self.provider):
+            async for event in self.model.stream_response(*args, **kwargs):
+                yield event
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        providers: dict[str, tuple[str | None, str | None]] = PROVIDERS,
+        limits: httpx.Limits = MODEL_HTTP_LIMITS,
+        concurrency: dict[str, int] | None = None,
+    ):
+        self.providers = providers
+        self.limits = limits
+        if concurrency is None:
+            concurrency = {provider: int(cap) for provider, cap in parse_rate_limits(PROVIDER_CONCURRENCY).items()}
+        self.concurrency = concurrency
+        self.http_client = None
+        self.clients = {}
+        self.models = {}
+        self.loop = None
+        self.slots = {}
+        self.counts = {"requests": 0, "connections": 0, "tls_handshakes": 0}
+        self.reported = dict(self.counts)
+
+    async def trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.counts["connections"] += 1
+        elif event_name == "connection.start_tls.complete":
+            self.counts["tls_handshakes"] += 1
+
+    async def on_request(self, request: httpx.Request):
+        # httpcore reports each new connection and TLS handshake to a trace callback on the request
+        self.counts["requests"] += 1
+        request.extensions["trace"] = self.trace
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        if self.http_client is None:
+            self.http_client = DefaultAsyncHttpxClient(
+                limits=self.limits, event_hooks={"request": [self.on_request]}
+            )
+        return self.http_client
+
+    def get_client(self, provider: str) -> AsyncOpenAI:
+        if provider not in self.clients:
+            base_url, api_key = self.providers[provider]
+            self.clients[provider] = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=self.get_http_client())
+        return self.clients[provider]
+
+    def get_model(self, model_name: str) -> Model:
+        """The shared model object for this model name, created on first use"""
+        provider = get_provider(model_name)
+        key = (provider, model_name)
+        if key not in self.models:
+            client = self.get_client(provider)
+            # OpenAI's own models use the Responses API, as the SDK does for a plain model name
+            model_class = OpenAIResponsesModel if provider == "openai" else OpenAIChatCompletionsModel
+            model = model_class(model=model_name, openai_client=client)
+            self.models[key] = CappedModel(model, self, provider) if provider in self.concurrency else model
+        return self.models[key]
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.slots = {provider: asyncio.Semaphore(cap) for provider, cap in self.concurrency.items()}
+        async with self.slots[provider]:
+            yield
+
+    def report(self) -> str:
+        """Summarize the model requests since the last report, and the connections they opened"""
+        since = {key: self.counts[key] - self.reported[key] for key in self.counts}
+        self.reported = dict(self.counts)
+        return (
+            f"Model clients: {since['requests']} requests, "
+            f"{since['connections']} new connections, {since['tls_handshakes']} TLS handshakes"
+        )
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_name: str) -> Model:
+    return registry.get_model(model_name)
@@ -0,0 +1,92 @@
+"""
+A local stand-in for the handful of Polygon REST endpoints that market.py uses.
+
+Prices are deterministic per symbol, so tests and benchmarks can run offline:
+
+    uv run polygon_stub.py
+    POLYGON_API_KEY=stub POLYGON_BASE_URL=http://127.0.0.1:8765 uv run trading_floor.py
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+POLYGON_STUB_PORT = int(os.getenv("POLYGON_STUB_PORT", "8765"))
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "BRK.B", "JPM", "V",
+           "SPY", "QQQ", "IWM", "GLD", "TLT", "IBIT", "FBTC", "ETHA", "COIN", "MSTR"]
+
+
+def price_for(symbol: str) -> float:
+    return 10 + zlib.crc32(symbol.encode()) % 49_000 / 100
+
+
+def snapshot(symbol: str) -> dict:
+    price = price_for(symbol)
+    return {"ticker": symbol, "min": {"c": price}, "prevDay": {"c": round(price * 0.99, 2)}}
+
+
+class PolygonStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.server.throttle_every and self.server.requests % self.server.throttle_every == 0:
+            return self.send_json({"status": "ERROR", "error": "throttled"}, status=429)
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        now_ms = int(time.time() * 1000)
+        if url.path == "/v1/marketstatus/now":
+            self.send_json({"market": self.server.market})
+        elif parts[:3] == ["v2", "aggs", "ticker"] and parts[-1] == "prev":
+            symbol = parts[3]
+            self.send_json({"results": [{"T": symbol, "c": price_for(symbol), "t": now_ms}]})
+        elif parts[:3] == ["v2", "aggs", "grouped"]:
+            results = [{"T": symbol, "c": price_for(symbol), "t": now_ms} for symbol in SYMBOLS]
+            self.send_json({"results": results})
+        elif parts[:2] == ["v2", "snapshot"] and parts[-1] == "tickers":
+            tickers = parse_qs(url.query).get("tickers", [",".join(SYMBOLS)])[0].split(",")
+            self.send_json({"tickers": [snapshot(symbol) for symbol in tickers]})
+        elif parts[:2] == ["v2", "snapshot"]:
+            self.send_json({"ticker": snapshot(parts[-1])})
+        else:
+            self.send_json({"status": "NOT_FOUND"}, status=404)
+
+    def send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port: int = POLYGON_STUB_PORT, market: str = "open", throttle_every: int = 0):
+    """Create the stub server; throttle_every=n answers every nth request with a 429"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), PolygonStubHandler)
+    server.requests = 0
+    server.market = market
+    server.throttle_every = throttle_every
+    return server
+
+
+def start_in_background(**kwargs) -> tuple[ThreadingHTTPServer, str]:
+    """Start a stub server on a free port in a daemon thread and return it with its base URL"""
+    server = make_server(port=0, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    print(f"Polygon stub listening on http://127.0.0.1:{POLYGON_STUB_PORT}")
+    make_server().serve_forever()
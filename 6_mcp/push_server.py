@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 import requests
 from pydantic import BaseModel, Field
 from mcp.server.fastmcp import FastMCP
+from util import run_mcp_server
 
 load_dotenv(override=True)
 
@@ -28,4 +29,4 @@ def push(args: PushModelArgs):
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    run_mcp_server(mcp)
@@ -0,0 +1,102 @@
+"""
+Schedules trader runs for the trading floor.
+
+Rather than starting every trader at the same instant, each cycle spreads the starts over
+TRADER_STAGGER_SECONDS with a little random jitter, runs at most MAX_CONCURRENT_TRADERS at
+once, and spaces out runs on each model provider according to PROVIDER_RATE_LIMITS, given as
+runs per minute, like "openai=30,deepseek=10". A trader still running from the previous cycle
+when the next one starts is skipped for that cycle rather than run twice.
+"""
+
+import asyncio
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+MAX_CONCURRENT_TRADERS = int(os.getenv("MAX_CONCURRENT_TRADERS", "4"))
+TRADER_STAGGER_SECONDS = float(os.getenv("TRADER_STAGGER_SECONDS", "60"))
+TRADER_JITTER_SECONDS = float(os.getenv("TRADER_JITTER_SECONDS", "10"))
+PROVIDER_RATE_LIMITS = os.getenv("PROVIDER_RATE_LIMITS", "")
+
+
+def parse_rate_limits(spec: str) -> dict[str, float]:
+    limits = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            provider, per_minute = entry.split("=")
+            limits[provider.strip().lower()] = float(per_minute)
+    return limits
+
+
+class RateLimiter:
+    """Spaces out starts so that no more than per_minute begin in any minute"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60 / per_minute
+        self.next_start = 0.0
+
+    async def wait(self):
+        # Reserve the next slot before sleeping, so concurrent waiters queue up behind each other
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        traders: list,
+        provider_of,
+        max_concurrent: int = MAX_CONCURRENT_TRADERS,
+        stagger_seconds: float = TRADER_STAGGER_SECONDS,
+        jitter_seconds: float = TRADER_JITTER_SECONDS,
+        rate_limits: dict[str, float] | None = None,
+    ):
+        """provider_of maps a trader to the name of the model provider its runs use"""
+        self.traders = traders
+        self.provider_of = provider_of
+        self.max_concurrent = max_concurrent
+        self.stagger_seconds = stagger_seconds
+        self.jitter_seconds = jitter_seconds
+        self.rate_limits = parse_rate_limits(PROVIDER_RATE_LIMITS) if rate_limits is None else rate_limits
+        self.slots = None
+        self.limiters = {}
+        self.running = {}
+        self.overruns = 0
+
+    def start_offset(self, index: int) -> float:
+        spacing = self.stagger_seconds / len(self.traders)
+        return index * spacing + random.uniform(0, self.jitter_seconds)
+
+    async def run_trader(self, trader, delay: float):
+        await asyncio.sleep(delay)
+        # Wait out the provider's rate limit before taking a slot, so a trader held back by its
+        # provider doesn't keep traders on other providers waiting
+        provider = self.provider_of(trader)
+        if provider in self.rate_limits:
+            limiter = self.limiters.setdefault(provider, RateLimiter(self.rate_limits[provider]))
+            await limiter.wait()
+        async with self.slots:
+            await trader.run()
+
+    async def run_cycle(self):
+        """Start, staggered, every trader that isn't still running from the last cycle, and wait for them to finish"""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+        start = time.monotonic()
+        tasks = []
+        for index, trader in enumerate(self.traders):
+            previous = self.running.get(trader.name)
+            if previous and not previous.done():
+                self.overruns += 1
+                print(f"{trader.name} is still running from the last cycle; skipping it this cycle")
+                continue
+            task = asyncio.create_task(self.run_trader(trader, self.start_offset(index)))
+            self.running[trader.name] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        print(f"Ran {len(tasks)} of {len(self.traders)} traders in {time.monotonic() - start:.0f}s")
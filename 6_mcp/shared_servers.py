@@ -0,0 +1,44 @@
+"""
+Run one shared instance of each stateless MCP server over HTTP, for every trader to connect to.
+
+    uv run shared_servers.py
+
+Then add the printed <NAME>_MCP_URL lines to .env before starting trading_floor.py.
+Our own FastMCP servers serve streamable HTTP themselves; third party stdio servers
+are exposed over SSE through mcp-proxy.
+"""
+
+import os
+import subprocess
+from dotenv import load_dotenv
+from mcp_params import stateless_mcp_server_params
+
+load_dotenv(override=True)
+
+SHARED_MCP_BASE_PORT = int(os.getenv("SHARED_MCP_BASE_PORT", "8101"))
+
+
+def launch(name: str, params: dict, port: int) -> tuple[subprocess.Popen, str]:
+    env = os.environ | {key: value for key, value in params.get("env", {}).items() if value}
+    if params["args"] == ["run", f"{name}_server.py"]:
+        command = [params["command"], *params["args"], "streamable-http", str(port)]
+        url = f"http://127.0.0.1:{port}/mcp"
+    else:
+        command = ["uvx", "mcp-proxy", "--port", str(port), "--pass-environment", "--",
+                   params["command"], *params["args"]]
+        url = f"http://127.0.0.1:{port}/sse"
+    return subprocess.Popen(command, env=env), url
+
+
+if __name__ == "__main__":
+    processes = []
+    for offset, (name, params) in enumerate(stateless_mcp_server_params.items()):
+        process, url = launch(name, params, SHARED_MCP_BASE_PORT + offset)
+        processes.append(process)
+        print(f"{name.upper()}_MCP_URL={url}")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
@@ -74,6 +74,7 @@ Use the tools to research stock price and other company information affecting yo
 Finally, make you decision, then execute trades using the tools as needed.
 You do not need to identify new investment opportunities at this time; you will be asked to do so later.
 Just rebalance your portfolio based on your strategy as needed.
+To make several trades at once, place them together with the execute_orders tool rather than one at a time.
 Your investment strategy:
 {strategy}
 You also have a tool to change your strategy if you wish; you can decide at any time that you would like to evolve or even switch your strategy.
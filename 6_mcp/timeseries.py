@@ -0,0 +1,90 @@
+"""
+Tiered storage for an account's portfolio value history.
+
+Recent values are kept as raw (timestamp, value) points. Points older than
+PORTFOLIO_RAW_HOURS are rolled up into hourly OHLC bars, and hourly bars older than
+PORTFOLIO_HOURLY_DAYS into daily bars, so the history stays bounded however long an
+account runs. A bar is a tuple of (start, resolution, open, high, low, close).
+"""
+
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+PORTFOLIO_RAW_HOURS = float(os.getenv("PORTFOLIO_RAW_HOURS", "24"))
+PORTFOLIO_HOURLY_DAYS = float(os.getenv("PORTFOLIO_HOURLY_DAYS", "30"))
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+RESOLUTIONS = ("raw", "hour", "day")
+
+Point = tuple[str, float]
+Bar = tuple[str, str, float, float, float, float]
+
+
+def bucket(timestamp: str, resolution: str) -> str:
+    """Return the start of the hour or day that the timestamp falls in"""
+    if resolution == "hour":
+        return timestamp[:13] + ":00:00"
+    return timestamp[:10] + " 00:00:00"
+
+
+def merge_bars(bars: list[Bar]) -> list[Bar]:
+    """Combine bars for the same period and resolution into one, ordered by start"""
+    merged = {}
+    for bar in sorted(bars, key=lambda bar: bar[0]):
+        start, resolution, open, high, low, close = bar
+        key = (start, resolution)
+        if key in merged:
+            _, _, open, previous_high, previous_low, _ = merged[key]
+            high, low = max(high, previous_high), min(low, previous_low)
+        merged[key] = (start, resolution, open, high, low, close)
+    return sorted(merged.values(), key=lambda bar: bar[0])
+
+
+def to_bars(points: list[Point], resolution: str) -> list[Bar]:
+    return merge_bars([(bucket(when, resolution), resolution, value, value, value, value) for when, value in points])
+
+
+def rebucket(bars: list[Bar], resolution: str) -> list[Bar]:
+    return merge_bars([(bucket(bar[0], resolution), resolution, *bar[2:]) for bar in bars])
+
+
+def needs_compaction(points: list[Point], now: datetime) -> bool:
+    """True once the oldest raw point is an hour past the raw window, so we compact at most hourly"""
+    if not points:
+        return False
+    cutoff = now - timedelta(hours=PORTFOLIO_RAW_HOURS + 1)
+    return points[0][0] < cutoff.strftime(TIMESTAMP_FORMAT)
+
+
+def compact(points: list[Point], bars: list[Bar], now: datetime) -> tuple[list[Point], list[Bar]]:
+    """Roll points and hourly bars that have aged out of their tier into the next one"""
+    raw_cutoff = (now - timedelta(hours=PORTFOLIO_RAW_HOURS)).strftime(TIMESTAMP_FORMAT)
+    hourly_cutoff = (now - timedelta(days=PORTFOLIO_HOURLY_DAYS)).strftime(TIMESTAMP_FORMAT)
+    recent = [point for point in points if point[0] >= raw_cutoff]
+    aged = [point for point in points if point[0] < raw_cutoff]
+    hourly = merge_bars([bar for bar in bars if bar[1] == "hour"] + to_bars(aged, "hour"))
+    daily = [bar for bar in bars if bar[1] == "day"]
+    daily += rebucket([bar for bar in hourly if bar[0] < hourly_cutoff], "day")
+    hourly = [bar for bar in hourly if bar[0] >= hourly_cutoff]
+    return recent, merge_bars(daily) + hourly
+
+
+def series(points: list[Point], bars: list[Bar], resolution: str = "raw") -> list[Point]:
+    """
+    Return a chart-ready (timestamp, value) series at the requested resolution.
+
+    "raw" gives the closing value of each stored bar followed by the raw points; "hour"
+    and "day" resample everything to closing values at that resolution, except that
+    periods only held as coarser daily bars stay daily.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution}; expected one of {RESOLUTIONS}")
+    if resolution == "raw":
+        return [(bar[0], bar[5]) for bar in bars] + list(points)
+    daily = [bar for bar in bars if bar[1] == "day"]
+    finer = [bar for bar in bars if bar[1] == "hour"] + to_bars(points, "hour")
+    resampled = merge_bars(daily + (rebucket(finer, "day") if resolution == "day" else finer))
+    return [(bar[0], bar[5]) for bar in resampled]
@@ -1,7 +1,9 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from database import LogWriter, MetricsWriter
+from datetime import datetime, timezone
 import secrets
 import string
+import time
 
 ALPHANUM = string.ascii_lowercase + string.digits 
 
@@ -15,28 +17,28 @@ def make_trace_id(tag: str) -> str:
     random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
     return f"trace_{tag}{random_suffix}"
 
+def trace_tag(trace_or_span: Trace | Span) -> str | None:
+    """Return the tag that make_trace_id put in this trace's id, or None for a trace it didn't make"""
+    name = trace_or_span.trace_id.split("_")[1]
+    return name.split("0")[0] if "0" in name else None
+
 class LogTracer(TracingProcessor):
 
-    def get_name(self, trace_or_span: Trace | Span) -> str | None:
-        trace_id = trace_or_span.trace_id
-        name = trace_id.split("_")[1]
-        if '0' in name:
-            return name.split("0")[0]
-        else:
-            return None
+    def __init__(self):
+        self.log_writer = LogWriter()
 
     def on_trace_start(self, trace) -> None:
-        name = self.get_name(trace)
+        name = trace_tag(trace)
         if name:
-            write_log(name, "trace", f"Started: {trace.name}")
+            self.log_writer.write(name, "trace", f"Started: {trace.name}")
 
     def on_trace_end(self, trace) -> None:
-        name = self.get_name(trace)
+        name = trace_tag(trace)
         if name:
-            write_log(name, "trace", f"Ended: {trace.name}")
+            self.log_writer.write(name, "trace", f"Ended: {trace.name}")
 
     def on_span_start(self, span) -> None:
-        name = self.get_name(span)
+        name = trace_tag(span)
         type = span.span_data.type if span.span_data else "span"
         if name:
             message = "Started"
@@ -49,10 +51,10 @@ class LogTracer(TracingProcessor):
                     message += f" {span.span_data.server}"
             if span.error:
                 message += f" {span.error}"
-            write_log(name, type, message)
+            self.log_writer.write(name, type, message)
 
     def on_span_end(self, span) -> None:
-        name = self.get_name(span)
+        name = trace_tag(span)
         type = span.span_data.type if span.span_data else "span"
         if name:
             message = "Ended"
@@ -66,10 +68,86 @@ class LogTracer(TracingProcessor):
                     message += f" {span.span_data.server}"
             if span.error:
                 message += f" {span.error}"
-            write_log(name, type, message)
+            self.log_writer.write(name, type, message)
 
     def force_flush(self) -> None:
+        self.log_writer.flush()
+
+    def shutdown(self) -> None:
+        self.log_writer.shutdown()
+
+
+class MetricsTracer(TracingProcessor):
+    """
+    Records how long each span of a trader's run takes into the metrics table, with the tokens
+    used by model calls, and one row per trace with the run's duration, total tokens and tool calls.
+    The trader's model is read from the trace metadata; see Trader.run_with_trace.
+    """
+
+    def __init__(self):
+        self.metrics_writer = MetricsWriter()
+        self.traces = {}
+
+    def on_trace_start(self, trace) -> None:
+        name = trace_tag(trace)
+        if name:
+            metadata = getattr(trace, "metadata", None) or {}
+            self.traces[trace.trace_id] = {
+                "name": name,
+                "model": metadata.get("model"),
+                "started": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "start": time.perf_counter(),
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "tool_calls": 0,
+            }
+
+    def on_trace_end(self, trace) -> None:
+        run = self.traces.pop(trace.trace_id, None)
+        if run:
+            self.metrics_writer.write(
+                trace.trace_id, run["name"], run["model"], "trace", trace.name, run["started"],
+                time.perf_counter() - run["start"], run["input_tokens"], run["output_tokens"], run["tool_calls"],
+            )
+
+    def on_span_start(self, span) -> None:
         pass
 
+    def span_name(self, data) -> str | None:
+        if data.type in ("generation", "response"):
+            response = getattr(data, "response", None)
+            return getattr(data, "model", None) or getattr(response, "model", None)
+        return getattr(data, "name", None) or getattr(data, "server", None)
+
+    def span_usage(self, data) -> tuple[int, int]:
+        if data.type == "generation" and data.usage:
+            return data.usage.get("input_tokens") or 0, data.usage.get("output_tokens") or 0
+        usage = getattr(getattr(data, "response", None), "usage", None)
+        if data.type == "response" and usage:
+            return usage.input_tokens, usage.output_tokens
+        return 0, 0
+
+    def on_span_end(self, span) -> None:
+        run = self.traces.get(span.trace_id)
+        if not run or not span.span_data or not span.started_at or not span.ended_at:
+            return
+        data = span.span_data
+        started = datetime.fromisoformat(span.started_at)
+        duration = (datetime.fromisoformat(span.ended_at) - started).total_seconds()
+        input_tokens, output_tokens = self.span_usage(data)
+        tool_calls = 1 if data.type == "function" else 0
+        run["input_tokens"] += input_tokens
+        run["output_tokens"] += output_tokens
+        run["tool_calls"] += tool_calls
+        error = span.error.get("message") if span.error else None
+        self.metrics_writer.write(
+            span.trace_id, run["name"], run["model"], data.type, self.span_name(data),
+            started.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), duration,
+            input_tokens, output_tokens, tool_calls, error,
+        )
+
+    def force_flush(self) -> None:
+        self.metrics_writer.flush()
+
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        self.metrics_writer.shutdown()
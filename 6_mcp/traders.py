@@ -1,12 +1,12 @@
 from contextlib import AsyncExitStack
-from accounts_client import read_accounts_resource, read_strategy_resource
+from accounts_client import read_summary_resource, read_strategy_resource
+from accounts import Account
 from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from agents import Agent, Tool, Runner, trace, custom_span
 from dotenv import load_dotenv
-import os
-import json
-from agents.mcp import MCPServerStdio
+import asyncio
+from mcp_servers import make_mcp_server
+from model_registry import get_model
 from templates import (
     researcher_instructions,
     trader_instructions,
@@ -18,36 +18,8 @@ from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
 
 load_dotenv(override=True)
 
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-google_api_key = os.getenv("GOOGLE_API_KEY")
-grok_api_key = os.getenv("GROK_API_KEY")
-openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-
-DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
-GROK_BASE_URL = "https://api.x.ai/v1"
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
-
-
-def get_model(model_name: str):
-    if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
-    elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
-    elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
-    elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
-        return model_name
-
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
     researcher = Agent(
@@ -65,12 +37,13 @@ async def get_researcher_tool(mcp_servers, model_name) -> Tool:
 
 
 class Trader:
-    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini"):
+    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini", server_pool=None):
         self.name = name
         self.lastname = lastname
         self.agent = None
         self.model_name = model_name
         self.do_trade = True
+        self.server_pool = server_pool
 
     async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
         tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
@@ -84,10 +57,8 @@ class Trader:
         return self.agent
 
     async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        """The compact account summary for the prompt, which stays the same size however old the account is"""
+        return await read_summary_resource(self.name)
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
         self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
@@ -99,28 +70,37 @@ class Trader:
             else rebalance_message(self.name, strategy, account)
         )
         await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        # Reading the summary writes nothing, so record the portfolio value here, once per run
+        await asyncio.to_thread(lambda: Account.get(self.name).snapshot())
+
+    async def run_with_pooled_mcp_servers(self):
+        with custom_span("mcp_startup"):
+            trader_mcp_servers = await self.server_pool.get_all(trader_mcp_server_params)
+            researcher_mcp_servers = await self.server_pool.get_all(
+                researcher_mcp_server_params(self.name)
+            )
+        await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
     async def run_with_mcp_servers(self):
+        if self.server_pool:
+            return await self.run_with_pooled_mcp_servers()
         async with AsyncExitStack() as stack:
-            trader_mcp_servers = [
-                await stack.enter_async_context(
-                    MCPServerStdio(params, client_session_timeout_seconds=120)
-                )
-                for params in trader_mcp_server_params
-            ]
-            async with AsyncExitStack() as stack:
+            # Timed as its own span, so the metrics show what spawning the servers costs each run
+            with custom_span("mcp_startup"):
+                trader_mcp_servers = [
+                    await stack.enter_async_context(make_mcp_server(params))
+                    for params in trader_mcp_server_params
+                ]
                 researcher_mcp_servers = [
-                    await stack.enter_async_context(
-                        MCPServerStdio(params, client_session_timeout_seconds=120)
-                    )
+                    await stack.enter_async_context(make_mcp_server(params))
                     for params in researcher_mcp_server_params(self.name)
                 ]
-                await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+            await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
     async def run_with_trace(self):
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
-        with trace(trace_name, trace_id=trace_id):
+        with trace(trace_name, trace_id=trace_id, metadata={"model": self.model_name}):
             await self.run_with_mcp_servers()
 
     async def run(self):
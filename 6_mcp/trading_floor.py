@@ -1,9 +1,14 @@
 from traders import Trader
+from model_registry import get_provider, registry as model_registry
 from typing import List
 import asyncio
-from tracers import LogTracer
+from tracers import LogTracer, MetricsTracer
 from agents import add_trace_processor
-from market import is_market_open
+from market_calendar import market_calendar
+from accounts_client import pool as accounts_client_pool
+from mcp_servers import MCPServerPool
+from scheduler import Scheduler
+from database import enqueue_job, has_pending_job
 from dotenv import load_dotenv
 import os
 
@@ -14,6 +19,12 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+# "per_run" starts every trader's MCP servers afresh for each run; "persistent" starts
+# them once, shares identical ones across traders, and health-checks them between runs
+MCP_SERVER_LIFECYCLE = os.getenv("MCP_SERVER_LIFECYCLE", "per_run").strip().lower()
+# "local" runs every trader in this process; "queue" only enqueues a job per trader each
+# cycle, for worker processes started with worker.py to run
+TRADING_FLOOR_MODE = os.getenv("TRADING_FLOOR_MODE", "local").strip().lower()
 
 names = ["Warren", "George", "Ray", "Cathie"]
 lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
@@ -31,24 +42,73 @@ else:
     short_model_names = ["GPT 4o mini"] * 4
 
 
-def create_traders() -> List[Trader]:
+def create_traders(server_pool: MCPServerPool | None = None) -> List[Trader]:
     traders = []
     for name, lastname, model_name in zip(names, lastnames, model_names):
-        traders.append(Trader(name, lastname, model_name))
+        traders.append(Trader(name, lastname, model_name, server_pool=server_pool))
     return traders
 
 
+async def run_cycle(scheduler: Scheduler):
+    await scheduler.run_cycle()
+    print(accounts_client_pool.report())
+    print(model_registry.report())
+
+
+async def wait_for_market_open():
+    """Sleep until the market next opens, or return at once if it's open or we run regardless"""
+    if RUN_EVEN_WHEN_MARKET_IS_CLOSED:
+        return
+    wait = market_calendar.seconds_until_open()
+    if wait:
+        print(f"Market is closed; sleeping {wait / 60:.0f} minutes until it opens")
+        await asyncio.sleep(wait)
+
+
+def enqueue_cycle(cycle: int):
+    """Queue a run of every trader that doesn't still have a job queued or running from an earlier cycle"""
+    for name, lastname, model_name in zip(names, lastnames, model_names):
+        if has_pending_job("name", name):
+            print(f"{name} still has a job queued or running; skipping it this cycle")
+            continue
+        job = {"name": name, "lastname": lastname, "model_name": model_name, "do_trade": cycle % 2 == 0}
+        enqueue_job(job)
+
+
+async def coordinate_every_n_minutes():
+    cycle = 0
+    while True:
+        await wait_for_market_open()
+        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or market_calendar.is_open():
+            enqueue_cycle(cycle)
+            cycle += 1
+            await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+
+
 async def run_every_n_minutes():
     add_trace_processor(LogTracer())
-    traders = create_traders()
+    add_trace_processor(MetricsTracer())
+    server_pool = MCPServerPool() if MCP_SERVER_LIFECYCLE == "persistent" else None
+    traders = create_traders(server_pool)
+    scheduler = Scheduler(traders, provider_of=lambda trader: get_provider(trader.model_name))
+    cycles = set()
     while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+        await wait_for_market_open()
+        if not (RUN_EVEN_WHEN_MARKET_IS_CLOSED or market_calendar.is_open()):
+            continue
+        # Cycles start on a fixed cadence; one that overruns keeps going in the background
+        next_cycle = asyncio.get_running_loop().time() + RUN_EVERY_N_MINUTES * 60
+        if server_pool:
+            await server_pool.health_check()
+        cycle = asyncio.create_task(run_cycle(scheduler))
+        cycles.add(cycle)
+        cycle.add_done_callback(cycles.discard)
+        await asyncio.sleep(next_cycle - asyncio.get_running_loop().time())
 
 
 if __name__ == "__main__":
     print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
-    asyncio.run(run_every_n_minutes())
+    if TRADING_FLOOR_MODE == "queue":
+        asyncio.run(coordinate_every_n_minutes())
+    else:
+        asyncio.run(run_every_n_minutes())
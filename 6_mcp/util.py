@@ -1,3 +1,4 @@
+import sys
 from enum import Enum
 
 css = """
@@ -48,3 +49,11 @@ class Color(Enum):
     MAGENTA = "#aa00dd"
     CYAN = "#00dddd"
     WHITE = "#87CEEB"
+
+
+def run_mcp_server(mcp):
+    """Run a FastMCP server over stdio, or over HTTP when started with: streamable-http|sse [port]"""
+    transport = sys.argv[1] if len(sys.argv) > 1 else "stdio"
+    if len(sys.argv) > 2:
+        mcp.settings.port = int(sys.argv[2])
+    mcp.run(transport=transport)
@@ -0,0 +1,105 @@
+"""
+Run trader cycles pulled from the job queue that trading_floor.py fills in queue mode.
+
+    uv run worker.py [number of worker processes]
+
+Each worker process leases one job at a time, renews the lease and its own heartbeat while
+the trader runs, and marks the job done or failed; failed and abandoned jobs are retried by
+whichever worker claims them next, up to JOB_MAX_ATTEMPTS times.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+from agents import add_trace_processor
+from dotenv import load_dotenv
+from database import (
+    WORKER_HEARTBEAT_SECONDS,
+    claim_job,
+    renew_job_lease,
+    complete_job,
+    fail_job,
+    write_worker_heartbeat,
+)
+from mcp_servers import MCPServerPool
+from tracers import LogTracer, MetricsTracer
+from traders import Trader
+
+load_dotenv(override=True)
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "5"))
+MCP_SERVER_LIFECYCLE = os.getenv("MCP_SERVER_LIFECYCLE", "per_run").strip().lower()
+
+
+async def keep_alive(worker: str, job_id: int, run: asyncio.Task):
+    """Renew the lease and heartbeat while the job runs, and cancel it if the lease is lost"""
+    while True:
+        await asyncio.sleep(min(WORKER_HEARTBEAT_SECONDS, JOB_LEASE_SECONDS / 3))
+        write_worker_heartbeat(worker, job_id)
+        if not renew_job_lease(job_id, worker, JOB_LEASE_SECONDS):
+            print(f"{worker} lost its lease on job {job_id}")
+            run.cancel()
+            return
+
+
+async def run_job(worker: str, job_id: int, payload: dict, server_pool: MCPServerPool | None):
+    trader = Trader(payload["name"], payload["lastname"], payload["model_name"], server_pool=server_pool)
+    trader.do_trade = payload["do_trade"]
+    run = asyncio.create_task(trader.run_with_trace())
+    heartbeat = asyncio.create_task(keep_alive(worker, job_id, run))
+    try:
+        await run
+        complete_job(job_id, worker)
+    except asyncio.CancelledError:
+        if not run.cancelled():
+            raise
+    except Exception as e:
+        print(f"{worker} failed job {job_id} for {trader.name}: {e}")
+        fail_job(job_id, worker, repr(e), JOB_MAX_ATTEMPTS)
+    finally:
+        heartbeat.cancel()
+
+
+async def work(worker: str):
+    add_trace_processor(LogTracer())
+    add_trace_processor(MetricsTracer())
+    server_pool = MCPServerPool() if MCP_SERVER_LIFECYCLE == "persistent" else None
+    try:
+        while True:
+            job = claim_job(worker, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS)
+            write_worker_heartbeat(worker, job[0] if job else None)
+            if job is None:
+                await asyncio.sleep(WORKER_POLL_SECONDS)
+                continue
+            job_id, payload, attempt = job
+            print(f"{worker} running job {job_id}: {payload['name']} (attempt {attempt})")
+            if server_pool:
+                await server_pool.health_check()
+            await run_job(worker, job_id, payload, server_pool)
+    finally:
+        if server_pool:
+            await server_pool.close()
+
+
+def main():
+    asyncio.run(work(f"{socket.gethostname()}-{os.getpid()}"))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    # Spawned rather than forked: importing database opened a SQLite connection here, and SQLite
+    # connections must not be carried across fork(), so each worker starts afresh and opens its own
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=main) for _ in range(count)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()